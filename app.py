@@ -1,23 +1,242 @@
 
+import atexit
+import cProfile
 import csv
+import io
 import os
-
-try:
-    for f in ['cache.db', 'cache.db-wal', 'cache.db-shm']:
-        if os.path.exists(f):
-            os.remove(f)
-except Exception:
-    pass
-
-from datetime import datetime, timedelta
-from flask import Flask, render_template, abort, request
+import pstats
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import wraps
+import base64
+import hashlib
+import hmac
+import json
+import tempfile
+import time
+from flask import Flask, render_template, abort, request, g
+from markupsafe import Markup, escape
 import db
+import metrics
 import threading
 
 app = Flask(__name__)
 
-CSV_FILE = 'access_counts.csv'
-csv_lock = threading.Lock()
+SYNC_TRIGGER_TOKEN = os.getenv('SYNC_TRIGGER_TOKEN')
+# Requests sent with a matching X-Profile-Token header return a cProfile report instead of their body.
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN')
+PROFILE_TOP_FUNCTIONS = 40
+SYNC_STALE_AFTER = int(os.getenv('SYNC_STALE_AFTER', str(2 * db.SYNC_MAX_INTERVAL)))
+
+CSV_FILE = os.getenv('ACCESS_COUNTS_FILE', 'access_counts.csv')
+CSV_FIELDS = ['ip', 'count', 'last_access']
+ACCESS_FLUSH_INTERVAL = 10
+ACCESS_FLUSH_THRESHOLD = 500
+
+@contextmanager
+def file_lock(path):
+    """Holds an exclusive lock on `path` across processes, waiting for it if needed."""
+    with open(path, 'a+') as f:
+        if os.name == 'nt':
+            import msvcrt
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            yield
+
+class AccessCounter:
+    """Aggregates access counts in memory and writes them to the CSV in the background."""
+
+    def __init__(self, path, interval=ACCESS_FLUSH_INTERVAL, threshold=ACCESS_FLUSH_THRESHOLD):
+        self.path = path
+        self.interval = interval
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+        self._pending = {}
+        self._pending_hits = 0
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+
+        self.flush_thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self.flush_thread.start()
+        atexit.register(self.close)
+
+    def record(self, ip, when):
+        """Counts one access for `ip`. Only touches memory."""
+        with self._lock:
+            entry = self._pending.get(ip)
+            if entry:
+                entry[0] += 1
+                entry[1] = when
+            else:
+                self._pending[ip] = [1, when]
+            self._pending_hits += 1
+            if self._pending_hits >= self.threshold:
+                self._wake.set()
+
+    def _flush_loop(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def _read(self):
+        """Returns the counts stored in the CSV. Raises if the file cannot be parsed."""
+        data = {}
+        if not os.path.exists(self.path):
+            return data
+        with open(self.path, mode='r', newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                data[row['ip']] = {
+                    'count': int(row['count']),
+                    'last_access': row['last_access']
+                }
+        return data
+
+    def _requeue(self, deltas):
+        """Puts deltas that could not be written back in front of the newer ones."""
+        with self._lock:
+            for ip, (count, last_access) in deltas.items():
+                entry = self._pending.get(ip)
+                if entry:
+                    entry[0] += count
+                    entry[1] = max(entry[1], last_access)
+                else:
+                    self._pending[ip] = [count, last_access]
+                self._pending_hits += count
+
+    def flush(self):
+        """Merges the pending deltas into the CSV file.
+
+        If the file cannot be read or written the deltas stay pending for
+        the next flush; an unreadable file is never overwritten.
+        """
+        with self._lock:
+            deltas = self._pending
+            self._pending = {}
+            self._pending_hits = 0
+
+        if not deltas:
+            return
+
+        # Every worker process flushes into the same file.
+        with self._file_lock, file_lock(self.path + '.lock'):
+            try:
+                data = self._read()
+            except (OSError, ValueError, KeyError, TypeError, csv.Error) as e:
+                print(f"Error reading CSV, keeping {len(deltas)} pending entries: {e}")
+                self._requeue(deltas)
+                return
+
+            for ip, (count, last_access) in deltas.items():
+                if ip in data:
+                    data[ip]['count'] += count
+                    data[ip]['last_access'] = max(data[ip]['last_access'], last_access)
+                else:
+                    data[ip] = {'count': count, 'last_access': last_access}
+
+            tmp_path = None
+            try:
+                directory, name = os.path.split(os.path.abspath(self.path))
+                fd, tmp_path = tempfile.mkstemp(prefix=name + '.', suffix='.tmp', dir=directory)
+                with os.fdopen(fd, mode='w', newline='', encoding='utf-8') as f:
+                    writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+                    writer.writeheader()
+                    for ip, info in data.items():
+                        writer.writerow({
+                            'ip': ip,
+                            'count': info['count'],
+                            'last_access': info['last_access']
+                        })
+                # mkstemp creates the file private to the owner.
+                os.chmod(tmp_path, 0o644)
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                print(f"Error writing CSV, keeping {len(deltas)} pending entries: {e}")
+                self._requeue(deltas)
+                if tmp_path and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    def close(self):
+        """Stops the flusher and writes whatever is still pending."""
+        self._stopped.set()
+        self._wake.set()
+        self.flush()
+
+access_counter = AccessCounter(CSV_FILE)
+
+REQUEST_SECONDS = metrics.Histogram("http_request_duration_seconds", "Request latency by endpoint, method and status.", ["endpoint", "method", "status"])
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        REQUEST_SECONDS.observe(time.perf_counter() - start, request.endpoint or 'unmatched', request.method, response.status_code)
+    return response
+
+# cProfile can only profile one thread at a time.
+profile_lock = threading.Lock()
+
+@app.before_request
+def start_profiler():
+    token = request.headers.get('X-Profile-Token')
+    if not token or not PROFILE_TOKEN:
+        return
+    if not hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode()):
+        abort(401)
+    if not profile_lock.acquire(blocking=False):
+        abort(409)
+
+    db.start_query_trace()
+    g.profiler = cProfile.Profile()
+    g.profiler.enable()
+
+def stop_profiler():
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return None, None
+    profiler.disable()
+    queries = db.stop_query_trace()
+    profile_lock.release()
+    return profiler, queries
+
+@app.after_request
+def return_profile(response):
+    """Replaces the response of a profiled request with the profile report."""
+    profiler, queries = stop_profiler()
+    if profiler is None:
+        return response
+
+    report = io.StringIO()
+    report.write(f"{request.method} {request.full_path.rstrip('?')} -> {response.status}\n\n")
+    report.write(f"Queries ({len(queries)}, {sum(q[1] for q in queries) * 1000:.2f}ms):\n")
+    for name, seconds, rows in queries:
+        report.write(f"  {name:<20} {seconds * 1000:8.2f}ms {rows:6d} rows\n")
+    report.write("\n")
+    pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+
+    profiled = app.response_class(report.getvalue(), content_type='text/plain; charset=utf-8')
+    profiled.headers['Cache-Control'] = 'no-store'
+    return profiled
+
+@app.teardown_request
+def release_profiler(exc):
+    # Only does something when the request failed before after_request ran.
+    stop_profiler()
 
 @app.before_request
 def log_access_to_csv():
@@ -35,140 +254,409 @@ def log_access_to_csv():
         client_ip = "'" + client_ip
 
     now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    access_counter.record(client_ip, now)
+
+PAGE_CACHE_MAX_ENTRIES = 512
+PAGE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+# Stands in for the "last updated" footer in cached pages, which changes on every sync check.
+LAST_SYNC_MARKER = b'<!--last-sync-->'
+
+class PageCache:
+    """LRU cache of rendered responses, valid for a single cache version."""
+
+    def __init__(self, max_entries=PAGE_CACHE_MAX_ENTRIES, max_bytes=PAGE_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+
+    def _reset(self, version):
+        self._entries.clear()
+        self._size = 0
+        self._version = version
+
+    def get(self, version, key):
+        with self._lock:
+            if version != self._version:
+                self._reset(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, version, key, entry):
+        size = len(entry['body'])
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            # Rendered against a version that has been replaced meanwhile.
+            if version != self._version:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old['body'])
+            self._entries[key] = entry
+            self._size += size
+
+            while self._entries and (len(self._entries) > self.max_entries or self._size > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted['body'])
+
+page_cache = PageCache()
+
+@metrics.register_collector
+def _collect_page_cache_metrics():
+    yield "page_cache_lookups_total", "counter", "Rendered page cache lookups by result.", [
+        ({'result': 'hit'}, page_cache.hits),
+        ({'result': 'miss'}, page_cache.misses),
+    ]
+    yield "page_cache_entries", "gauge", "Responses held by the page cache.", [({}, len(page_cache._entries))]
+    yield "page_cache_bytes", "gauge", "Body bytes held by the page cache.", [({}, page_cache._size)]
+
+def cached_page(view):
+    """Caches the view's response per route and args until the cached data changes.
+
+    Responses carry a strong ETag and a Last-Modified header, and conditional
+    GETs are answered with 304. The "last updated" footer is filled in on
+    every response, so sync checks that find nothing new keep the entries.
+    Profiled requests always run the view.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if 'profiler' in g:
+            return view(*args, **kwargs)
 
-    with csv_lock:
-        data = {}
+        version = db.get_sync_generation()
+        key = (request.endpoint, tuple(sorted(kwargs.items())), tuple(sorted(request.args.items(multi=True))))
 
-        if os.path.exists(CSV_FILE):
+        entry = page_cache.get(version, key)
+        if entry is None:
+            g.page_cache_render = True
             try:
-                with open(CSV_FILE, mode='r', newline='', encoding='utf-8') as f:
-                    reader = csv.DictReader(f)
-                    for row in reader:
-                        data[row['ip']] = {
-                            'count': int(row['count']),
-                            'last_access': row['last_access']
-                        }
-            except Exception as e:
-                print(f"Error reading CSV: {e}")
-
-        if client_ip in data:
-            data[client_ip]['count'] += 1
-            data[client_ip]['last_access'] = now
+                response = app.make_response(view(*args, **kwargs))
+            finally:
+                g.pop('page_cache_render', None)
+            if response.status_code != 200:
+                return response
+
+            body = response.get_data()
+            entry = {
+                'body': body,
+                'mimetype': response.mimetype,
+                'etag': hashlib.blake2b(body, digest_size=16).hexdigest(),
+                'has_last_sync': LAST_SYNC_MARKER in body,
+            }
+            page_cache.put(version, key, entry)
+
+        body, etag = entry['body'], entry['etag']
+        if entry['has_last_sync']:
+            footer = str(escape(last_sync_text())).encode()
+            body = body.replace(LAST_SYNC_MARKER, footer)
+            etag += '-' + hashlib.blake2b(footer, digest_size=4).hexdigest()
+
+        response = app.response_class(body, mimetype=entry['mimetype'])
+        response.set_etag(etag)
+        last_modified = db.get_last_modified_time()
+        if last_modified:
+            response.last_modified = datetime.fromtimestamp(last_modified, tz=timezone.utc)
+        return response.make_conditional(request)
+
+    return wrapper
+
+HISTORY_MAX_PAGE_SIZE = 5000
+
+def encode_history_cursor(row):
+    """Opaque cursor pointing just after `row` in (date_start, id) order."""
+    raw = json.dumps([row['date_start'], row['cashback_id']])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_history_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        date_start, cashback_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return (str(date_start), int(cashback_id))
+    except (ValueError, TypeError):
+        abort(400)
+
+def lttb(points, threshold):
+    """Largest-Triangle-Three-Buckets downsampling of (x, y, item) points sorted by x."""
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return points
+
+    sampled = [points[0]]
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0
+
+    for i in range(threshold - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+
+        next_start = end
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        if next_start >= n:
+            avg_x, avg_y = points[-1][0], points[-1][1]
         else:
-            data[client_ip] = {'count': 1, 'last_access': now}
+            next_bucket = points[next_start:next_end]
+            avg_x = sum(p[0] for p in next_bucket) / len(next_bucket)
+            avg_y = sum(p[1] for p in next_bucket) / len(next_bucket)
 
-        try:
-            with open(CSV_FILE, mode='w', newline='', encoding='utf-8') as f:
-                fieldnames = ['ip', 'count', 'last_access']
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writeheader()
-                for ip, info in data.items():
-                    writer.writerow({
-                        'ip': ip,
-                        'count': info['count'],
-                        'last_access': info['last_access']
-                    })
-        except Exception as e:
-            print(f"Error writing CSV: {e}")
-
-def adjust_to_brasilia(val):
-    """
-    Adjusts a UTC timestamp string (or date string) to Brasilia time (UTC-3).
-    Handles both 'YYYY-MM-DD HH:MM:SS' and 'YYYY-MM-DD' formats.
+        ax, ay = points[a][0], points[a][1]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (points[j][1] - ay) - (ax - points[j][0]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+
+        sampled.append(points[best])
+        a = best
+
+    sampled.append(points[-1])
+    return sampled
+
+def downsample_history(rows, max_points):
+    """Keeps at most `max_points` rows, split between platforms, picked with LTTB per platform.
+
+    Platforms with fewer rows than their share keep them all and leave the
+    rest to the others. A share too small for LTTB keeps the first and last
+    rows, or only the last (the current offer), or nothing.
     """
-    if not val:
-        return None
+    series = {}
+    for row in rows:
+        series.setdefault(row['platform_id'], []).append((row['ts'] or 0, row['value'] or 0, row))
+
+    kept = []
+    budget = max_points
+    ordered = sorted(series.values(), key=len)
+    for i, points in enumerate(ordered):
+        share = budget // (len(ordered) - i)
+        if len(points) <= share:
+            chosen = points
+        elif share >= 3:
+            chosen = lttb(points, share)
+        elif share == 2:
+            chosen = [points[0], points[-1]]
+        else:
+            chosen = points[-1:] if share else []
+        kept.extend(point[2] for point in chosen)
+        budget -= len(chosen)
 
-    dt = None
-    try:
+    kept.sort(key=lambda r: (r['date_start'], r['cashback_id']))
+    return kept
+
+def encode_history_columnar(rows):
+    """Encodes history rows as parallel arrays.
 
-        dt = datetime.strptime(str(val), "%Y-%m-%d %H:%M:%S")
+    Start times are epoch seconds, delta-encoded from the previous row
+    (the first one is absolute); durations are seconds from start, null for
+    active offers. Platforms and descriptions are indexes into the
+    `platforms` and `descriptions` lists.
+    """
+    platforms = {}
+    descriptions = {}
+    columns = {'start': [], 'duration': [], 'value': [], 'value_specific': [], 'platform': [], 'description': []}
+
+    previous = 0
+    for row in rows:
+        ts = row['ts'] or 0
+        columns['start'].append(ts - previous)
+        columns['duration'].append(row['ts_end'] - ts if row['ts_end'] is not None else None)
+        columns['value'].append(row['value'])
+        columns['value_specific'].append(row['value_specific'])
+
+        platform_key = (row['platform_id'], row['platform_name'])
+        columns['platform'].append(platforms.setdefault(platform_key, len(platforms)))
+        columns['description'].append(descriptions.setdefault(row['description'], len(descriptions)))
+        previous = ts
+
+    return {
+        'format': 'columnar',
+        'count': len(rows),
+        'platforms': [{'id': pid, 'name': name} for pid, name in platforms],
+        'descriptions': list(descriptions),
+        **columns,
+    }
+
+HISTORY_RAW_MAX_DAYS = 92
+HISTORY_DAILY_MAX_DAYS = 3 * 366
+
+def date_to_epoch(value):
+    """Epoch seconds of a UTC 'YYYY-MM-DD[ HH:MM:SS]' string; 400 if malformed."""
+    try:
+        return int(datetime.fromisoformat(value).replace(tzinfo=timezone.utc).timestamp())
     except ValueError:
-        try:
+        abort(400)
 
-            dt = datetime.strptime(str(val), "%Y-%m-%d")
-        except ValueError:
-            return val
+def history_resolution(start_date, end_date):
+    """Picks 'raw', 'daily' or 'weekly' history for the requested range.
 
-    dt = dt - timedelta(hours=3)
-    return dt.strftime("%Y-%m-%d %H:%M:%S")
+    Open-ended requests get raw rows; the resolution arg overrides the choice.
+    """
+    requested = request.args.get('resolution', 'auto')
+    if requested in ('raw',) + tuple(db.ROLLUPS):
+        return requested
+    if not start_date:
+        return 'raw'
+
+    end = date_to_epoch(end_date) if end_date else time.time()
+    days = (end - date_to_epoch(start_date)) / 86400
+    if days <= HISTORY_RAW_MAX_DAYS:
+        return 'raw'
+    if days <= HISTORY_DAILY_MAX_DAYS:
+        return 'daily'
+    return 'weekly'
+
+def rollup_to_dict(row):
+    return {
+        'date': db.local_time(row['bucket_start']),
+        'platform': row['platform_name'],
+        'platform_id': row['platform_id'],
+        'min': row['min_global'],
+        'max': row['max_global'],
+        'avg': row['avg_global'],
+        'min_specific': row['min_specific'],
+        'max_specific': row['max_specific'],
+        'avg_specific': row['avg_specific'],
+        'coverage': row['covered_seconds'],
+    }
+
+def encode_rollups_columnar(rows, resolution):
+    """Columnar encoding of rollup buckets, laid out like encode_history_columnar."""
+    platforms = {}
+    columns = {key: [] for key in ('start', 'platform', 'min', 'max', 'avg', 'min_specific', 'max_specific', 'avg_specific', 'coverage')}
+
+    previous = 0
+    for row in rows:
+        columns['start'].append(row['bucket_start'] - previous)
+        columns['platform'].append(platforms.setdefault((row['platform_id'], row['platform_name']), len(platforms)))
+        columns['min'].append(row['min_global'])
+        columns['max'].append(row['max_global'])
+        columns['avg'].append(row['avg_global'])
+        columns['min_specific'].append(row['min_specific'])
+        columns['max_specific'].append(row['max_specific'])
+        columns['avg_specific'].append(row['avg_specific'])
+        columns['coverage'].append(row['covered_seconds'])
+        previous = row['bucket_start']
+
+    return {
+        'format': 'columnar',
+        'resolution': resolution,
+        'count': len(rows),
+        'platforms': [{'id': pid, 'name': name} for pid, name in platforms],
+        **columns,
+    }
+
+def format_local_time(local):
+    """Formats a local 'YYYY-MM-DD HH:MM:SS' string as 'DD/MM/YYYY HH:MM'."""
+    if not local:
+        return "-"
+    if len(local) < 16:
+        return local
+    return f"{local[8:10]}/{local[5:7]}/{local[0:4]} {local[11:16]}"
 
 def to_brasilia(value):
-    """Converts UTC date/timestamp to Brasilia time (UTC-3)."""
+    """Converts UTC date/timestamp to Brasilia time."""
     if not value:
         return "-"
+    if not isinstance(value, (str, int, float)):
+        return value
 
-    try:
-        if isinstance(value, (int, float)):
+    local = db.local_time(value)
+    return format_local_time(local) if local else value
 
-            dt = datetime.utcfromtimestamp(value)
-        elif isinstance(value, str):
+app.jinja_env.filters['brasilia_time'] = to_brasilia
+app.jinja_env.filters['local_time'] = format_local_time
 
-            dt = datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
-        else:
-            return value
+def last_sync_text():
+    ts = db.get_last_sync_time()
+    return to_brasilia(ts) if ts else "Nunca"
 
-        dt = dt - timedelta(hours=3)
-        return dt.strftime("%d/%m/%Y %H:%M")
-    except ValueError:
-        try:
+@app.context_processor
+def inject_last_sync():
+    if g.get('page_cache_render'):
+        return dict(last_sync=Markup(LAST_SYNC_MARKER.decode()))
+    return dict(last_sync=last_sync_text())
 
-             dt = datetime.strptime(value, "%Y-%m-%d %H:%M")
-             dt = dt - timedelta(hours=3)
-             return dt.strftime("%d/%m/%Y %H:%M")
-        except:
-             return value
-    except Exception:
-        return value
+def store_listing_args():
+    """Reads q, platforms, mode, sort and page for the store listing."""
+    platform_ids = []
+    for value in request.args.getlist('platforms'):
+        for part in value.split(','):
+            if part.strip().isdigit():
+                platform_ids.append(int(part))
 
-app.jinja_env.filters['brasilia_time'] = to_brasilia
+    mode = request.args.get('mode', 'global')
+    if mode not in ('global', 'max'):
+        mode = 'global'
 
-@app.context_processor
-def inject_last_sync():
-    ts = db.get_last_sync_time()
-    if ts:
-        formatted_time = to_brasilia(ts)
-    else:
-        formatted_time = "Nunca"
-    return dict(last_sync=formatted_time)
+    sort = request.args.get('sort', 'cashback-desc')
+    if sort not in db.STORE_SORTS:
+        sort = 'cashback-desc'
+
+    page = max(request.args.get('page', 1, type=int), 1)
+    return request.args.get('q', '').strip(), platform_ids, mode, sort, page
 
 @app.route('/')
+@cached_page
 def index():
-
-    stores = db.get_stores_with_all_cashbacks() 
+    query, platform_ids, mode, sort, _ = store_listing_args()
+    total, stores = db.search_stores(query, platform_ids, mode, sort)
     all_platforms = db.get_platforms()
-    print(f"DEBUG: APP Index found {len(stores)} stores")
 
-    return render_template('index.html', stores=stores, platforms=all_platforms)
+    return render_template('index.html', stores=stores, total=total, platforms=all_platforms,
+                           selected_platforms=platform_ids, mode=mode, sort=sort, page_size=db.STORES_PAGE_SIZE)
+
+@app.route('/api/stores')
+@cached_page
+def api_stores():
+    """Paginated best-offer listing used by the index page."""
+    query, platform_ids, mode, sort, page = store_listing_args()
+    total, stores = db.search_stores(query, platform_ids, mode, sort, page)
+
+    return {
+        "stores": stores,
+        "total": total,
+        "page": page,
+        "page_size": db.STORES_PAGE_SIZE,
+        "has_more": page * db.STORES_PAGE_SIZE < total,
+    }
 
 @app.route('/store/<int:store_id>')
+@cached_page
 def store_details(store_id):
     data = db.get_store_details(store_id)
     if not data:
         abort(404)
 
-    history_rows = db.get_cashback_history(store_id, None, None, None)
-    history_data = []
-    for row in history_rows:
-        history_data.append({
-            'date': adjust_to_brasilia(row['date_start']),
-            'date_end': adjust_to_brasilia(row['date_end']),
-            'value': row['value'],
-            'value_specific': row['value_specific'],
-            'description': row['description'],
-            'platform': row['platform_name'],
-            'platform_id': row['platform_id']
-        })
-
-    return render_template('store.html', store=data['store'], cashbacks=data['cashbacks'], history_data=history_data)
+    return render_template('store.html', store=data['store'], cashbacks=data['cashbacks'])
 
 @app.route('/platforms')
+@cached_page
 def platforms():
     platforms_list = db.get_platforms()
     return render_template('platforms.html', platforms=platforms_list)
 
 @app.route('/api/store/<int:store_id>/history')
+@cached_page
 def store_history(store_id):
+    """Cashback history of a store.
+
+    Query args: start/end (YYYY-MM-DD), platforms (comma separated ids),
+    limit and cursor for pagination, max_points to get a downsampled
+    series for charts instead of every row (flagged "downsampled": the
+    rows between kept ones are missing), and format=rows for one object
+    per row instead of the columnar encoding. Long ranges are answered from
+    the daily or weekly rollups; resolution=raw|daily|weekly forces one.
+    """
     start_date = request.args.get('start')
     end_date = request.args.get('end')
 
@@ -186,14 +674,51 @@ def store_history(store_id):
         except ValueError:
             pass 
 
-    history_rows = db.get_cashback_history(store_id, start_date, end_date, platform_ids)
+    resolution = history_resolution(start_date, end_date)
+    if resolution != 'raw':
+        start_ts = date_to_epoch(start_date) if start_date else None
+        end_ts = date_to_epoch(end_date) + 1 if end_date else None
+        rollup_rows = db.get_cashback_rollups(store_id, resolution, start_ts, end_ts, platform_ids)
+        if request.args.get('format', 'columnar') == 'columnar':
+            return encode_rollups_columnar(rollup_rows, resolution)
+        return {"resolution": resolution, "history": [rollup_to_dict(row) for row in rollup_rows]}
+
+    max_points = request.args.get('max_points', type=int)
+    limit = request.args.get('limit', type=int)
+    after = decode_history_cursor(request.args.get('cursor'))
+
+    # A downsampled series is always complete, so it cannot be paged.
+    if max_points is not None and (max_points < 1 or after):
+        abort(400)
+
+    if max_points:
+        history_rows = db.get_cashback_history(store_id, start_date, end_date, platform_ids)
+        history_rows = downsample_history(history_rows, max_points)
+        next_cursor = None
+    else:
+        if limit:
+            limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+        history_rows = db.get_cashback_history(store_id, start_date, end_date, platform_ids, after, limit + 1 if limit else None)
+        next_cursor = None
+        if limit and len(history_rows) > limit:
+            history_rows = history_rows[:limit]
+            next_cursor = encode_history_cursor(history_rows[-1])
+
+    if request.args.get('format', 'columnar') == 'columnar':
+        response = encode_history_columnar(history_rows)
+        response["resolution"] = "raw"
+        if next_cursor:
+            response["next_cursor"] = next_cursor
+        if max_points:
+            response["downsampled"] = True
+        return response
 
     data = []
     for row in history_rows:
 
         data.append({
-            'date': adjust_to_brasilia(row['date_start']),
-            'date_end': adjust_to_brasilia(row['date_end']),
+            'date': row['local_start'],
+            'date_end': row['local_end'],
             'value': row['value'],
             'value_specific': row['value_specific'],
             'description': row['description'],
@@ -201,7 +726,53 @@ def store_history(store_id):
             'platform_id': row['platform_id']
         })
 
-    return {"history": data}
+    response = {"resolution": "raw", "history": data}
+    if next_cursor:
+        response["next_cursor"] = next_cursor
+    if max_points:
+        response["downsampled"] = True
+    return response
+
+@app.route('/healthz/sync')
+def sync_health():
+    """Sync freshness for load balancers: 503 once the last successful check
+    is older than SYNC_STALE_AFTER seconds (or there never was one)."""
+    state = db.get_sync_state()
+    now = time.time()
+
+    staleness = now - state['last_success'] if state['last_success'] else None
+    lag = None
+    if state['remote_watermark'] is not None and state['local_watermark'] is not None:
+        lag = max(state['remote_watermark'] - state['local_watermark'], 0.0)
+
+    healthy = staleness is not None and staleness <= SYNC_STALE_AFTER
+    body = dict(state)
+    body.update({
+        'status': 'ok' if healthy else 'stale',
+        'staleness_seconds': staleness,
+        'lag_seconds': lag,
+        'stale_after_seconds': SYNC_STALE_AFTER,
+    })
+    return body, 200 if healthy else 503
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape target for this worker process."""
+    return app.response_class(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/internal/sync', methods=['POST'])
+def trigger_sync():
+    """Lets the upstream writer ask for an immediate sync after it changes data."""
+    if not SYNC_TRIGGER_TOKEN:
+        abort(404)
+
+    auth = request.headers.get('Authorization', '')
+    token = auth[len('Bearer '):] if auth.startswith('Bearer ') else ''
+    if not hmac.compare_digest(token.encode(), SYNC_TRIGGER_TOKEN.encode()):
+        abort(401)
+
+    queued = db.request_sync()
+    return {"queued": queued, "coalesced": not queued}, 202
 
 if __name__ == '__main__':
     cert = os.getenv('SSL_CERT_PATH')
@@ -0,0 +1,34 @@
+"""Setup shared by the benchmark scripts.
+
+db opens its cache on import and starts syncing from Turso unless
+CACHE_OFFLINE is set, so the scripts import it through offline_db().
+"""
+import os
+
+def offline_db(path):
+    """Imports db serving the cache file at `path` without ever syncing.
+
+    Has to run before anything else imports db.
+    """
+    os.environ["CACHE_DB_PATH"] = path
+    os.environ["CACHE_OFFLINE"] = "1"
+    import db
+    return db
+
+def new_cache(db, path):
+    """Opens a CacheManager over a new, empty cache file at `path` and makes
+    it the one the module-level db functions read from."""
+    db.LOCAL_DB = path
+    db.LEADER_LOCK_FILE = path + ".lock"
+    db.SYNC_REQUEST_FILE = path + ".sync-request"
+    db.REBUILD_REQUEST_FILE = path + ".rebuild-request"
+    db.CacheManager._delete_cache_files()
+
+    manager = object.__new__(db.CacheManager)
+    manager._init_cache()
+    db.cache_manager = manager
+    return manager
+
+def count_rows(db, conn):
+    """Returns the row count of every synced table in the cache behind `conn`."""
+    return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in db.STAGED_TABLES}
@@ -0,0 +1,95 @@
+"""Benchmark of best-offer ranking: SQL over the cache vs the offer matrix.
+
+For several platform subsets and both view modes, times the top stores by
+best offer computed with a GROUP BY over the latest cashbacks and with
+OfferMatrix.
+
+Usage: python bench_offer_matrix.py [stores] [platforms]
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+
+import bench_common
+
+TOP_N = 60
+
+SQL = """
+    SELECT pa.store_id,
+        MAX(CASE WHEN ? = 'max' AND c.value_specific > c.value_global THEN c.value_specific ELSE c.value_global END) AS best
+    FROM partnerships pa
+    JOIN cashbacks c ON c.id = (
+        SELECT lc.id FROM cashbacks lc
+        WHERE lc.partnership_id = pa.id
+        ORDER BY lc.date_start DESC, lc.id DESC
+        LIMIT 1
+    )
+    WHERE pa.platform_id IN ({placeholders})
+    GROUP BY pa.store_id
+    ORDER BY best DESC
+    LIMIT ?
+"""
+
+def build(db, path, stores, platforms):
+    manager = bench_common.new_cache(db, path)
+    conn = manager.conn
+
+    rng = random.Random(3)
+    conn.executemany("INSERT INTO stores (id, name, url) VALUES (?, ?, '')", [(i, f"Store {i}") for i in range(1, stores + 1)])
+    conn.executemany("INSERT INTO platforms (id, name, url) VALUES (?, ?, '')", [(i, f"Platform {i}") for i in range(1, platforms + 1)])
+
+    partnerships, cashbacks = [], []
+    for store_id in range(1, stores + 1):
+        for platform_id in rng.sample(range(1, platforms + 1), rng.randint(1, min(6, platforms))):
+            partnerships.append((len(partnerships) + 1, store_id, platform_id))
+            for day in range(3):
+                value = rng.randint(0, 30) / 2
+                specific = value + rng.choice([0, 0, 1, 2.5])
+                cashbacks.append((len(cashbacks) + 1, len(partnerships), value, specific, f"2024-01-{day + 1:02d} 00:00:00"))
+    conn.executemany("INSERT INTO partnerships (id, store_id, platform_id, url) VALUES (?, ?, ?, '')", partnerships)
+    conn.executemany("INSERT INTO cashbacks (id, partnership_id, value_global, value_specific, description, date_start, date_end) VALUES (?, ?, ?, ?, '', ?, ?)",
+                     [row + (row[-1],) for row in cashbacks])
+    conn.commit()
+    return manager
+
+def timed(fn, repeat=10):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def main():
+    stores = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    platforms = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "cache.db")
+        run(bench_common.offline_db(path), path, stores, platforms)
+
+def run(db, path, stores, platforms):
+    manager = build(db, path, stores, platforms)
+
+    start = time.perf_counter()
+    snapshot = db.IndexSnapshot(0, manager._load_stores_with_all_cashbacks())
+    build_ms = (time.perf_counter() - start) * 1000
+    matrix = snapshot.matrix
+
+    print(f"--- {stores} stores x {platforms} platforms, top {TOP_N} ---")
+    print(f"snapshot + matrix build: {build_ms:.1f} ms (once per sync)")
+    print(f"{'platforms':<14} {'mode':<7} {'SQL':>10} {'matrix':>10}")
+
+    rng = random.Random(5)
+    subsets = [list(range(1, platforms + 1)), [1], rng.sample(range(1, platforms + 1), max(1, platforms // 3))]
+    for platform_ids in subsets:
+        for mode in ("global", "max"):
+            sql = SQL.format(placeholders=",".join("?" * len(platform_ids)))
+            sql_ms = timed(lambda: manager.conn.execute(sql, [mode, *platform_ids, TOP_N]).fetchall(), repeat=3)
+            matrix_ms = timed(lambda: matrix.top(matrix.best(platform_ids, mode)[0], TOP_N))
+            label = "all" if len(platform_ids) == platforms else ",".join(map(str, sorted(platform_ids)))
+            print(f"{label:<14} {mode:<7} {sql_ms:>7.2f} ms {matrix_ms:>7.2f} ms")
+
+if __name__ == "__main__":
+    main()
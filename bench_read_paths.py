@@ -0,0 +1,160 @@
+"""Benchmark of the db.py read paths over a generated cache.
+
+Serves the cache built by generate_cache.py offline (CACHE_OFFLINE=1),
+times every case and prints the results as JSON. With --baseline, cases
+whose median got slower than the baseline by more than --tolerance are
+reported as regressions and the exit status is 1.
+
+Usage: python generate_cache.py
+       python bench_read_paths.py [--db bench_data/cache.db] [--repeat 200]
+           [--output results.json] [--baseline bench_baseline.json]
+           [--save-baseline] [--tolerance 0.25]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import contextlib
+import statistics
+from datetime import datetime, timedelta
+
+import bench_common
+
+# Differences below this many milliseconds are timer noise, not regressions.
+MIN_REGRESSION_MS = 0.05
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--db", default=os.path.join("bench_data", "cache.db"))
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--output", help="also write the results to this file")
+    parser.add_argument("--baseline", help="baseline results to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results to --baseline instead of comparing")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed median slowdown, as a fraction")
+    parser.add_argument("--seed", type=int, default=7)
+    return parser.parse_args(argv)
+
+def build_cases(db, rng):
+    """Returns {name: callable}. Callables taking a store id cycle through a fixed sample."""
+    snapshot = db.cache_manager.get_index_snapshot()
+    store_ids = [store['id'] for store in snapshot.stores]
+    sample = rng.sample(store_ids, min(len(store_ids), 50))
+    busiest = max(sample, key=lambda store_id: len(db.get_cashback_history(store_id)))
+
+    # A word that occurs in some names, and a two-letter prefix.
+    words = sorted({word for store in snapshot.stores for word in store['name'].split() if len(word) >= 4})
+    search_query = rng.choice(words)[:5].lower()
+    short_query = snapshot.stores[0]['name'][:2].lower()
+
+    end = datetime.fromtimestamp(db.get_last_modified_time())
+    recent = ((end - timedelta(days=90)).strftime("%Y-%m-%d %H:%M:%S"), end.strftime("%Y-%m-%d %H:%M:%S"))
+
+    def cycling(fn):
+        ids = iter(())
+        def call():
+            nonlocal ids
+            store_id = next(ids, None)
+            if store_id is None:
+                ids = iter(sample)
+                store_id = next(ids)
+            return fn(store_id)
+        return call
+
+    return {
+        'stores_all': lambda: db.get_stores_with_all_cashbacks(),
+        'stores_search': lambda: db.get_stores_with_all_cashbacks(search_query),
+        'stores_search_short': lambda: db.get_stores_with_all_cashbacks(short_query),
+        'store_details': cycling(db.get_store_details),
+        'cashback_history': cycling(db.get_cashback_history),
+        'cashback_history_busiest': lambda: db.get_cashback_history(busiest),
+        'cashback_history_90d': cycling(lambda store_id: db.get_cashback_history(store_id, *recent)),
+        'platforms': lambda: db.get_platforms(),
+    }, {'search_query': search_query, 'short_query': short_query, 'busiest_store': busiest}
+
+def measure(fn, repeat, warmup):
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return {
+        'median_ms': statistics.median(times),
+        'mean_ms': statistics.fmean(times),
+        'min_ms': times[0],
+        'p95_ms': times[min(len(times) - 1, int(len(times) * 0.95))],
+        'max_ms': times[-1],
+    }
+
+def compare(results, baseline, tolerance):
+    """Returns the regressions of `results` against `baseline` as readable lines."""
+    regressions = []
+    if baseline.get('dataset') != results['dataset']:
+        print(f"WARNING: Baseline was measured on a different data set: {baseline.get('dataset')}", file=sys.stderr)
+
+    for name, current in results['cases'].items():
+        old = baseline.get('cases', {}).get(name)
+        if old is None:
+            continue
+        now_ms, old_ms = current['median_ms'], old['median_ms']
+        current['baseline_median_ms'] = old_ms
+        current['change'] = now_ms / old_ms - 1 if old_ms else None
+        if now_ms > old_ms * (1 + tolerance) and now_ms - old_ms > MIN_REGRESSION_MS:
+            regressions.append(f"{name}: median {old_ms:.3f}ms -> {now_ms:.3f}ms ({current['change']:+.0%})")
+    return regressions
+
+def run(args):
+    db = bench_common.offline_db(args.db)
+
+    cases, parameters = build_cases(db, random.Random(args.seed))
+    results = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': db.sqlite3.sqlite_version,
+        'dataset': bench_common.count_rows(db, db.cache_manager.conn),
+        'parameters': dict(parameters, repeat=args.repeat),
+        'cases': {},
+    }
+    for name, fn in cases.items():
+        results['cases'][name] = measure(fn, args.repeat, args.warmup)
+        print(f"DEBUG: {name}: median {results['cases'][name]['median_ms']:.3f}ms")
+    return results
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not os.path.exists(args.db):
+        sys.exit(f"{args.db} not found, run generate_cache.py first.")
+
+    # Keeps the DEBUG output of db off stdout, which only carries the JSON.
+    with contextlib.redirect_stdout(sys.stderr):
+        results = run(args)
+
+    regressions = []
+    if args.baseline and not args.save_baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        results['regressions'] = regressions
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    if args.save_baseline:
+        if not args.baseline:
+            sys.exit("--save-baseline needs --baseline.")
+        with open(args.baseline, 'w') as f:
+            f.write(text + "\n")
+    print(text)
+
+    for line in regressions:
+        print(f"REGRESSION: {line}", file=sys.stderr)
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
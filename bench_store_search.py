@@ -0,0 +1,73 @@
+"""Benchmark of store name search over a synthetic cache.
+
+Compares a LIKE '%q%' scan of stores and the in-memory substring filter
+with db.search_store_ids over the stores_fts trigram index.
+
+Usage: python bench_store_search.py [stores]
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+
+import bench_common
+
+WORDS = ["Magazine", "Luíza", "Casas", "Bahia", "Americanas", "Submarino", "Netshoes", "Centauro",
+         "Drogaria", "São", "Paulo", "Farmácia", "Pão", "Açúcar", "Óticas", "Calçados", "Livraria",
+         "Cultura", "Renner", "Riachuelo", "Boticário", "Natura", "Decolar", "Hotéis", "Shopee"]
+
+SYLLABLES = ["ba", "ca", "da", "fe", "go", "lu", "ma", "ne", "pi", "ro", "sa", "ta", "vi", "xo", "zu", "ção", "lã", "mé"]
+
+QUERIES = ["luiza", "LUÍZA", "sao paulo", "farm", "maneta", "ca", "xyz123"]
+
+def build(db, path, stores):
+    manager = bench_common.new_cache(db, path)
+    conn = manager.conn
+
+    rng = random.Random(7)
+    names = set()
+    while len(names) < stores:
+        name = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+        if rng.random() < 0.1:
+            name += " " + rng.choice(WORDS)
+        names.add(name)
+    rows = list(enumerate(sorted(names), 1))
+    conn.executemany("INSERT INTO stores (id, name, url) VALUES (?, ?, '')", rows)
+    manager._index_store_names()
+    conn.commit()
+
+    # Short queries are answered from the index snapshot.
+    manager.index_snapshot = db.IndexSnapshot(0, [{'id': i, 'name': name, 'offers': []} for i, name in rows])
+    return manager
+
+def timed(fn, repeat=20):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, len(result)
+
+def main():
+    stores = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "cache.db")
+        run(bench_common.offline_db(path), path, stores)
+
+def run(db, path, stores):
+    manager = build(db, path, stores)
+    names = [(row[0], row[1].casefold()) for row in manager.conn.execute("SELECT id, name FROM stores")]
+
+    print(f"--- {stores} stores ---")
+    print(f"{'query':<12} {'LIKE scan':>16} {'casefold filter':>16} {'trigram index':>16}")
+    for query in QUERIES:
+        like = timed(lambda: manager.conn.execute("SELECT id FROM stores WHERE name LIKE ?", [f"%{query}%"]).fetchall())
+        needle = query.casefold()
+        scan = timed(lambda: [i for i, name in names if needle in name])
+        fts = timed(lambda: db.search_store_ids(query))
+        cells = [f"{t * 1000:7.2f} ms ({n:>5})" for t, n in (like, scan, fts)]
+        print(f"{query:<12} " + " ".join(f"{c:>16}" for c in cells))
+
+if __name__ == "__main__":
+    main()
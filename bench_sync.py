@@ -0,0 +1,176 @@
+"""Benchmark of sync_from_turso against the local Turso stand-in.
+
+For each history length, fills a remote_standin database with synthetic
+data (see generate_cache.py) and times, over the injected latency and
+bandwidth:
+
+- a cold sync into an empty cache;
+- an incremental sync after a scraper round that extends every open offer
+  and starts new offers on a fraction of the partnerships;
+- a probe when nothing changed.
+
+With --error-rate, failed syncs are retried and the attempts reported.
+
+Usage: python bench_sync.py [--years 0.5 1 2 4] [--stores 300] [--latency-ms 30]
+           [--bandwidth-mbps 20] [--error-rate 0] [--output results.json]
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import contextlib
+
+import bench_common
+import generate_cache
+import remote_standin
+
+MAX_ATTEMPTS = 20
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--years", type=float, nargs="+", default=[0.5, 1, 2, 4])
+    parser.add_argument("--stores", type=int, default=300)
+    parser.add_argument("--platforms", type=int, default=12)
+    parser.add_argument("--partnerships-per-store", type=int, default=3)
+    parser.add_argument("--offers-per-month", type=float, default=2)
+    parser.add_argument("--new-offers", type=float, default=0.05, help="fraction of partnerships with a new offer per round")
+    parser.add_argument("--latency-ms", type=float, default=30)
+    parser.add_argument("--bandwidth-mbps", type=float, default=20, help="0 for unlimited")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    return parser.parse_args(argv)
+
+def build_remote(path, args, years, now):
+    """Creates the stand-in remote with `years` of history. Returns its cashback count."""
+    remote_standin.create_remote_db(path)
+    stores, platforms, partnerships, cashbacks = generate_cache.synthetic_rows(
+        argparse.Namespace(**dict(vars(args), years=years)), now)
+
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO stores (id, name, url) VALUES (?, ?, ?)", stores)
+    conn.executemany("INSERT INTO platforms (id, name, url) VALUES (?, ?, ?)", platforms)
+    conn.executemany("INSERT INTO partnerships (id, store_id, platform_id, url) VALUES (?, ?, ?, ?)", partnerships)
+    for batch in cashbacks:
+        conn.executemany("INSERT INTO cashbacks (id, partnership_id, global_value, max_value, description, date_start, date_end) VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+    conn.execute("UPDATE table_updates SET updated_at = ?", (generate_cache.utc(now),))
+    conn.commit()
+    count = conn.execute("SELECT COUNT(*) FROM cashbacks").fetchone()[0]
+    conn.close()
+    return count
+
+def scrape_round(path, rng, new_offers, now):
+    """Applies what one scraper run does to the remote: every partnership's
+    latest offer is seen again until `now`, and some get a new offer."""
+    conn = sqlite3.connect(path)
+    latest = conn.execute("""
+        SELECT c.id, c.partnership_id, c.global_value FROM cashbacks c
+        WHERE c.id = (SELECT MAX(id) FROM cashbacks WHERE partnership_id = c.partnership_id)
+    """).fetchall()
+    stamp = generate_cache.utc(now)
+    conn.executemany("UPDATE cashbacks SET date_end = ? WHERE id = ?", [(stamp, cashback_id) for cashback_id, _, _ in latest])
+
+    changed = rng.sample(latest, int(len(latest) * new_offers))
+    conn.executemany("INSERT INTO cashbacks (partnership_id, global_value, max_value, description, date_start, date_end) VALUES (?, ?, ?, '', ?, ?)",
+                     [(partnership_id, value + 0.5, value + 0.5, stamp, stamp) for _, partnership_id, value in changed])
+    conn.execute("UPDATE table_updates SET updated_at = ? WHERE table_name = 'cashbacks'", (stamp,))
+    conn.commit()
+    conn.close()
+    return len(latest), len(changed)
+
+def timed_sync(manager, clients):
+    """Syncs until it succeeds. Returns the outcome, attempts, seconds of the
+    successful attempt, its phase timings, statements and bytes transferred."""
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        del clients[:]
+        start = time.perf_counter()
+        outcome = manager.sync_from_turso()
+        seconds = time.perf_counter() - start
+        if outcome != 'error':
+            break
+    timings = dict(manager.last_sync_timings) if outcome == 'changed' else {}
+    return {
+        'outcome': outcome,
+        'attempts': attempt,
+        'seconds': seconds,
+        'timings': timings,
+        'statements': sum(client.statements for client in clients),
+        'bytes': sum(client.bytes_sent for client in clients),
+    }
+
+def open_cache(db, path, clients, options):
+    """Returns a new CacheManager over an empty cache file that syncs from the stand-in."""
+    manager = bench_common.new_cache(db, path)
+
+    def connect():
+        client = remote_standin.LocalRemoteClient(options['path'], **options['client'])
+        clients.append(client)
+        return client
+    manager.remote_client_factory = connect
+    return manager
+
+def run(args, workdir):
+    # The cache db opens on import is replaced for every cold sync.
+    cache_path = os.path.join(workdir, "cache.db")
+    db = bench_common.offline_db(cache_path)
+
+    client_options = {
+        'latency': args.latency_ms / 1000,
+        'bandwidth': args.bandwidth_mbps * 125000 if args.bandwidth_mbps else None,
+        'error_rate': args.error_rate,
+    }
+    rng = random.Random(args.seed)
+    results = []
+    manager = db.cache_manager
+    for years in args.years:
+        remote_path = os.path.join(workdir, f"remote-{years:g}.db")
+        now = int(time.time())
+        cashbacks = build_remote(remote_path, args, years, now)
+
+        manager.conn.close()
+        manager.read_pool.reset()
+        clients = []
+        manager = open_cache(db, cache_path, clients, {'path': remote_path, 'client': client_options})
+
+        cold = timed_sync(manager, clients)
+        seen, started = scrape_round(remote_path, rng, args.new_offers, now + 3600)
+        incremental = timed_sync(manager, clients)
+        noop = timed_sync(manager, clients)
+
+        results.append({
+            'years': years,
+            'cashbacks': cashbacks,
+            'scrape_round': {'updated': seen, 'inserted': started},
+            'cold': cold,
+            'incremental': incremental,
+            'noop': noop,
+        })
+        print(f"DEBUG: {years:g} years done.")
+    return results
+
+def main(argv=None):
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory() as workdir:
+        # Keeps the DEBUG output of db off stdout.
+        with contextlib.redirect_stdout(sys.stderr):
+            results = run(args, workdir)
+
+    print(f"--- {args.stores} stores, latency {args.latency_ms:g}ms, bandwidth {args.bandwidth_mbps:g}Mbit/s, error rate {args.error_rate:g} ---")
+    print(f"{'years':>5} {'cashbacks':>9} {'cold':>18} {'incremental':>18} {'noop':>9}")
+    for r in results:
+        cells = [f"{r[k]['seconds']:6.2f}s {r[k]['bytes'] / 1e6:6.2f}MB" + ("*" if r[k]['attempts'] > 1 else " ")
+                 for k in ('cold', 'incremental')]
+        print(f"{r['years']:>5g} {r['cashbacks']:>9} {cells[0]:>18} {cells[1]:>18} {r['noop']['seconds']:8.3f}s")
+    if any(r[k]['attempts'] > 1 for r in results for k in ('cold', 'incremental', 'noop')):
+        print("* needed retries after injected errors")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'arguments': vars(args), 'results': results}, f, indent=2)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,72 @@
+"""Micro-benchmark of the per-request cost of showing history timestamps.
+
+Compares the old per-row strptime/shift/strftime conversion with reading the
+local-time columns precomputed at sync, and with the memoized db.local_time.
+
+Usage: python bench_timestamps.py [rows]
+"""
+import os
+import sys
+import time
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta
+
+import bench_common
+
+def legacy_adjust(val):
+    """The conversion the history endpoint used to run for every row."""
+    if not val:
+        return None
+    try:
+        dt = datetime.strptime(str(val), "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        try:
+            dt = datetime.strptime(str(val), "%Y-%m-%d")
+        except ValueError:
+            return val
+    dt = dt - timedelta(hours=3)
+    return dt.strftime("%Y-%m-%d %H:%M:%S")
+
+def build(rows, local_time):
+    conn = sqlite3.connect(":memory:")
+    conn.create_function("local_time", 1, local_time, deterministic=True)
+    conn.execute("CREATE TABLE cashbacks (id INTEGER PRIMARY KEY, date_start TEXT, date_end TEXT, local_start TEXT, local_end TEXT)")
+    conn.executemany(
+        "INSERT INTO cashbacks (id, date_start, date_end) VALUES (?, datetime('2020-01-01', '+' || ? || ' hours'), datetime('2020-01-01', '+' || ? || ' hours'))",
+        [(i, i, i + 6) for i in range(rows)])
+    conn.execute("UPDATE cashbacks SET local_start = local_time(date_start), local_end = local_time(date_end)")
+    return conn
+
+def timed(label, fn, repeat=5):
+    best = min(_run(fn) for _ in range(repeat))
+    print(f"{label:<28} {best * 1000:8.2f} ms")
+    return best
+
+def _run(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    with tempfile.TemporaryDirectory() as workdir:
+        db = bench_common.offline_db(os.path.join(workdir, "cache.db"))
+        run(db.local_time, rows)
+
+def run(local_time, rows):
+    conn = build(rows, local_time)
+    raw = conn.execute("SELECT date_start, date_end FROM cashbacks").fetchall()
+
+    print(f"--- {rows} history rows ---")
+    legacy = timed("strptime per row", lambda: [(legacy_adjust(s), legacy_adjust(e)) for s, e in raw])
+    local_time.cache_clear()
+    timed("local_time (cold cache)", lambda: [(local_time(s), local_time(e)) for s, e in raw], repeat=1)
+    timed("local_time (memoized)", lambda: [(local_time(s), local_time(e)) for s, e in raw])
+    precomputed = timed("precomputed columns", lambda: conn.execute("SELECT local_start, local_end FROM cashbacks").fetchall())
+    read_only = timed("read date columns only", lambda: conn.execute("SELECT date_start, date_end FROM cashbacks").fetchall())
+
+    print(f"Conversion overhead per request: {max(precomputed - read_only, 0) * 1000:.2f} ms precomputed vs {legacy * 1000:.2f} ms per-row strptime")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Shared test setup.
+
+db and app open their files on import, and db starts syncing from Turso
+unless CACHE_OFFLINE is set, so the environment is pointed at a temporary
+directory before any test module imports them.
+"""
+import os
+import sys
+import shutil
+import tempfile
+
+import pytest
+
+WORKDIR = tempfile.mkdtemp(prefix="moneyboost-tests-")
+os.environ["CACHE_DB_PATH"] = os.path.join(WORKDIR, "cache.db")
+os.environ["CACHE_OFFLINE"] = "1"
+os.environ["ACCESS_COUNTS_FILE"] = os.path.join(WORKDIR, "access_counts.csv")
+
+import db  # noqa: E402
+
+def pytest_unconfigure(config):
+    app = sys.modules.get("app")
+    if app is not None:
+        app.access_counter.close()
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+@pytest.fixture(scope="module")
+def make_cache(tmp_path_factory):
+    """Returns a function that opens a CacheManager, as a process would at
+    startup, over `path` or a new file. Managers are closed with the module."""
+    monkeypatch = pytest.MonkeyPatch()
+    managers = []
+
+    def make(path=None):
+        path = path or str(tmp_path_factory.mktemp("cache") / "cache.db")
+        monkeypatch.setattr(db, "LOCAL_DB", path)
+        monkeypatch.setattr(db, "LEADER_LOCK_FILE", path + ".lock")
+        monkeypatch.setattr(db, "SYNC_REQUEST_FILE", path + ".sync-request")
+        monkeypatch.setattr(db, "REBUILD_REQUEST_FILE", path + ".rebuild-request")
+        manager = object.__new__(db.CacheManager)
+        manager._init_cache()
+        managers.append(manager)
+        return manager
+
+    yield make
+    for manager in managers:
+        manager.read_pool.reset()
+        manager.conn.close()
+        if manager._lock_file is not None:
+            manager._lock_file.close()
+    monkeypatch.undo()
+
+@pytest.fixture
+def cache(make_cache):
+    """An empty cache of its own, served offline."""
+    return make_cache()
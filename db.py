@@ -1,18 +1,438 @@
 
 import os
+import json
 import time
+import random
+import asyncio
+import heapq
+import queue
 import sqlite3
 import threading
-from datetime import datetime
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 import libsql_client
+
+import metrics
 from dotenv import load_dotenv
 
 load_dotenv(override=True)
 
 URL = os.getenv("TURSO_DATABASE_URL")
 TOKEN = os.getenv("TURSO_AUTH_TOKEN")
-LOCAL_DB = "cache.db"
-CACHE_DURATION = 1800  
+LOCAL_DB = os.getenv("CACHE_DB_PATH", "cache.db")
+# Bump whenever the local tables change shape; older cache files are rebuilt.
+CACHE_SCHEMA_VERSION = 5
+LEADER_LOCK_FILE = LOCAL_DB + ".lock"
+SYNC_REQUEST_FILE = LOCAL_DB + ".sync-request"
+REBUILD_REQUEST_FILE = LOCAL_DB + ".rebuild-request"
+# Set CACHE_MULTI_WORKER=1 when several processes share cache.db (pre-fork
+# servers). One of them holds LEADER_LOCK_FILE and syncs; the others only read.
+MULTI_WORKER = os.getenv("CACHE_MULTI_WORKER") == "1"
+# Set CACHE_OFFLINE=1 to serve the cache file as it is, without ever syncing
+# (benchmarks over a generated cache, local development without Turso).
+OFFLINE = os.getenv("CACHE_OFFLINE") == "1"
+FOLLOWER_POLL_INTERVAL = 1.0
+FOLLOWER_STARTUP_TIMEOUT = 30
+SYNC_MIN_INTERVAL = 15
+SYNC_MAX_INTERVAL = 1800
+SYNC_BACKOFF_MAX = 900
+SYNC_STATE_PERSIST_INTERVAL = 300
+ROLLUP_EXTEND_INTERVAL = 3600
+READ_POOL_SIZE = int(os.getenv("CACHE_READ_POOL_SIZE", "8"))
+SYNC_PAGE_SIZE = int(os.getenv("SYNC_PAGE_SIZE", "1000"))
+# Read queries slower than this are logged with their plan; a negative value disables the log.
+SLOW_QUERY_SECONDS = float(os.getenv("CACHE_SLOW_QUERY_MS", "50")) / 1000
+STORES_PAGE_SIZE = 60
+STORE_SORTS = ("cashback-desc", "name-asc", "name-desc", "relevance")
+
+# Secondary indexes of the local cache. Indexes named idx_* that are not listed
+# here are dropped on startup, so this dict is the single source of truth.
+CACHE_INDEXES = {
+    # Partnerships by platform (store_id is covered by the UNIQUE autoindex).
+    "idx_partnerships_platform": "CREATE INDEX IF NOT EXISTS idx_partnerships_platform ON partnerships (platform_id, store_id)",
+    # Latest cashback per partnership: matches the vw_latest_cashbacks window order.
+    "idx_cashbacks_latest": "CREATE INDEX IF NOT EXISTS idx_cashbacks_latest ON cashbacks (partnership_id, date_start DESC, id DESC)",
+    # Offers still open past the rollup horizon, found on every publish.
+    "idx_cashbacks_ts_end": "CREATE INDEX IF NOT EXISTS idx_cashbacks_ts_end ON cashbacks (ts_end, partnership_id, ts_start)",
+    # A store's history in get_cashback_history order.
+    "idx_cashbacks_store": "CREATE INDEX IF NOT EXISTS idx_cashbacks_store ON cashbacks (store_id, date_start, id)",
+    # A store's rollup buckets in get_cashback_rollups order.
+    "idx_cashback_rollups_daily_store": "CREATE INDEX IF NOT EXISTS idx_cashback_rollups_daily_store ON cashback_rollups_daily (store_id, bucket_start, platform_id)",
+    "idx_cashback_rollups_weekly_store": "CREATE INDEX IF NOT EXISTS idx_cashback_rollups_weekly_store ON cashback_rollups_weekly (store_id, bucket_start, platform_id)",
+}
+
+# Rollup resolutions: table, bucket length in seconds and bucket origin.
+# Buckets are UTC; weekly ones start on Mondays (1970-01-05 is a Monday).
+ROLLUPS = {
+    "daily": ("cashback_rollups_daily", 86400, 0),
+    "weekly": ("cashback_rollups_weekly", 7 * 86400, 4 * 86400),
+}
+
+LOCAL_TIMEZONE = os.getenv("CACHE_TIMEZONE", "America/Sao_Paulo")
+try:
+    LOCAL_TZ = ZoneInfo(LOCAL_TIMEZONE)
+except ZoneInfoNotFoundError:
+    print(f"ERROR: Timezone {LOCAL_TIMEZONE} not found, falling back to UTC-3.")
+    LOCAL_TZ = timezone(timedelta(hours=-3))
+
+# Column order of the remote rows for each table copied by sync_from_turso.
+STAGED_TABLES = {
+    "stores": "id, name, url",
+    "platforms": "id, name, url",
+    "partnerships": "id, store_id, platform_id, url",
+    "cashbacks": "id, partnership_id, value_global, value_specific, description, date_start, date_end",
+}
+
+QUERY_SECONDS = metrics.Histogram("cache_query_duration_seconds", "Local cache query time by query name.", ["query"])
+QUERY_ROWS = metrics.Counter("cache_query_rows_total", "Rows returned by local cache queries by query name.", ["query"])
+SYNC_PHASE_SECONDS = metrics.Histogram("sync_phase_duration_seconds", "Duration of each completed sync phase (probe, fetch, publish, snapshot, total).", ["phase"])
+SYNC_CHECKS = metrics.Counter("sync_checks_total", "Sync checks by outcome.", ["outcome"])
+SYNC_ROWS = metrics.Counter("sync_rows_fetched_total", "Remote rows transferred by syncs.")
+SYNC_PAGES = metrics.Counter("sync_pages_fetched_total", "Remote pages requested by syncs.")
+SLOW_QUERIES = metrics.Counter("cache_slow_queries_total", "Local cache queries slower than CACHE_SLOW_QUERY_MS by query name.", ["query"])
+RANKING_LOOKUPS = metrics.Counter("index_ranking_lookups_total", "Store rankings served from the snapshot memo or computed.", ["result"])
+
+class OfferMatrix:
+    """Dense store x platform matrix of the latest offers of an index snapshot.
+
+    Holds one matrix per view mode: 'global' (value_global) and 'max' (the
+    higher of value_global and value_specific); missing offers are -1.
+    Stored as plain lists, one per platform column: a masked argmax over a
+    few platform columns is a single pass per column, so numpy would not
+    pay for a new dependency.
+    """
+
+    def __init__(self, stores):
+        self.platform_ids = sorted({offer['platform_id'] for store in stores for offer in store['offers']})
+        self.platform_names = {offer['platform_id']: offer['platform_name'] for store in stores for offer in store['offers']}
+        self._columns = {platform_id: i for i, platform_id in enumerate(self.platform_ids)}
+        self.size = len(stores)
+
+        width = len(self.platform_ids)
+        rows = {'global': [[-1.0] * width for _ in stores], 'max': [[-1.0] * width for _ in stores]}
+        for r, store in enumerate(stores):
+            for offer in store['offers']:
+                c = self._columns[offer['platform_id']]
+                value = offer['value']
+                specific = offer['value_specific']
+                rows['global'][r][c] = value
+                rows['max'][r][c] = specific if specific is not None and specific > value else value
+
+        self.values = {mode: [list(column) for column in zip(*m)] if m else [[] for _ in range(width)]
+                       for mode, m in rows.items()}
+
+    def columns(self, platform_ids):
+        """Matrix columns of `platform_ids`; every column if empty."""
+        if not platform_ids:
+            return list(range(len(self.platform_ids)))
+        return sorted({self._columns[p] for p in platform_ids if p in self._columns})
+
+    def best(self, platform_ids, mode):
+        """Masked argmax: (value, platform_id) of each store's best offer among
+        `platform_ids`, as two sequences indexed like the snapshot stores.
+        Stores without such an offer get value -1."""
+        columns = self.columns(platform_ids)
+        matrix = self.values['max' if mode == 'max' else 'global']
+
+        if not columns:
+            return [-1.0] * self.size, [None] * self.size
+
+        values = list(matrix[columns[0]])
+        arg = [columns[0]] * self.size
+        for c in columns[1:]:
+            for r, value in enumerate(matrix[c]):
+                if value > values[r]:
+                    values[r] = value
+                    arg[r] = c
+        return values, [self.platform_ids[c] for c in arg]
+
+    def top(self, values, limit=None):
+        """Rows with an offer, ordered by value (descending, stable); the first `limit` only if given."""
+        rows = [r for r in range(self.size) if values[r] >= 0]
+        if limit is not None and limit < len(rows):
+            return heapq.nsmallest(limit, rows, key=lambda r: (-values[r], r))
+        rows.sort(key=lambda r: -values[r])
+        return rows
+
+class IndexSnapshot:
+    """Immutable result of the index page query for one sync generation."""
+
+    def __init__(self, generation, stores):
+        self.generation = generation
+        self.stores = stores
+        self.names = [store['name'].casefold() for store in stores]
+        self.search_names = [normalize_name(store['name']) for store in stores]
+        self.matrix = OfferMatrix(stores)
+        self._rankings = OrderedDict()
+        self._rankings_lock = threading.Lock()
+
+    def ranking(self, platform_ids, mode, sort):
+        """Returns (name, store, platform_id, value) for every store with an
+        offer on one of `platform_ids` (any platform if empty), ordered by `sort`.
+
+        Computed once per snapshot and argument set; most recent 32 are kept.
+        """
+        key = (frozenset(platform_ids or ()), mode, sort)
+        with self._rankings_lock:
+            if key in self._rankings:
+                self._rankings.move_to_end(key)
+                RANKING_LOOKUPS.inc(1, 'hit')
+                return self._rankings[key]
+        RANKING_LOOKUPS.inc(1, 'miss')
+
+        values, platforms = self.matrix.best(key[0], mode)
+
+        if sort in ('name-asc', 'name-desc'):
+            rows = [r for r in range(len(self.stores)) if values[r] >= 0]
+            rows.sort(key=lambda r: (self.search_names[r], self.names[r]), reverse=sort == 'name-desc')
+        else:
+            rows = self.matrix.top(values)
+
+        ranked = [(self.names[r], self.stores[r], platforms[r], values[r]) for r in rows]
+
+        with self._rankings_lock:
+            self._rankings[key] = ranked
+            if len(self._rankings) > 32:
+                self._rankings.popitem(last=False)
+        return ranked
+
+class ReadPool:
+    """Fixed-size pool of read-only connections to the cache.
+
+    A thread keeps the same connection for nested checkouts, so a request that
+    runs several queries only waits for the pool once.
+    """
+
+    def __init__(self, path, size=READ_POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        for _ in range(size):
+            self._idle.put(None)
+        self._local = threading.local()
+        self._epochs = {}
+        self.epoch = 0
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def _connect(self):
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def acquire(self):
+        """Checks out a connection for the calling thread."""
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            self._local.depth += 1
+            return held
+
+        start = time.perf_counter()
+        try:
+            conn = self._idle.get_nowait()
+            waited = 0.0
+        except queue.Empty:
+            conn = self._idle.get()
+            waited = time.perf_counter() - start
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                self._idle.put(None)
+                raise
+            self._epochs[id(conn)] = self.epoch
+
+        with self._stats_lock:
+            self.checkouts += 1
+            if waited:
+                self.waits += 1
+                self.wait_time_total += waited
+                self.wait_time_max = max(self.wait_time_max, waited)
+
+        self._local.conn = conn
+        self._local.depth = 1
+        return conn
+
+    def release(self, conn):
+        """Returns a connection obtained from acquire()."""
+        if getattr(self._local, 'conn', None) is not conn:
+            return
+
+        self._local.depth -= 1
+        if self._local.depth == 0:
+            self._local.conn = None
+            if self._epochs.get(id(conn)) != self.epoch:
+                self._epochs.pop(id(conn), None)
+                conn.close()
+                conn = None
+            self._idle.put(conn)
+
+    def reset(self):
+        """Closes every connection so the next checkouts open the current cache file."""
+        self.epoch += 1
+        drained = []
+        while True:
+            try:
+                drained.append(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+        for conn in drained:
+            if conn is not None:
+                self._epochs.pop(id(conn), None)
+                conn.close()
+            self._idle.put(None)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'size': self.size,
+                'idle': self._idle.qsize(),
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'wait_time_total': self.wait_time_total,
+                'wait_time_max': self.wait_time_max,
+            }
+
+def create_remote_client():
+    """Returns an async client for the Turso database.
+
+    This is the default CacheManager.remote_client_factory. Any replacement
+    (see remote_standin.py) must return an object with the subset of the
+    libsql_client API the sync uses: `await execute(sql, params)` returning
+    a result whose `rows` are indexable by column position, and
+    `await close()`.
+    """
+    return libsql_client.create_client(url=URL, auth_token=TOKEN)
+
+def _try_lock(lock_file):
+    """Takes a non-blocking exclusive lock on an open file. Released when the process dies."""
+    try:
+        if os.name == 'nt':
+            import msvcrt
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+def is_corruption_error(error):
+    """Returns True if a sqlite3 error means the cache file itself is damaged."""
+    name = getattr(error, 'sqlite_errorname', None) or ''
+    return name.startswith(('SQLITE_CORRUPT', 'SQLITE_NOTADB'))
+
+def normalize_name(name):
+    """Casefolds `name` and strips accents, so 'Luíza' and 'luiza' compare equal."""
+    decomposed = unicodedata.normalize("NFKD", name.casefold())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+@lru_cache(maxsize=65536)
+def local_time(value):
+    """Converts a UTC timestamp (epoch seconds or 'YYYY-MM-DD[ HH:MM[:SS]]') to a
+    'YYYY-MM-DD HH:MM:SS' string in LOCAL_TZ, or None if it can't be parsed."""
+    try:
+        if isinstance(value, (int, float)):
+            dt = datetime.fromtimestamp(value, timezone.utc)
+        else:
+            dt = datetime.fromisoformat(str(value)).replace(tzinfo=timezone.utc)
+    except (ValueError, OverflowError, OSError):
+        return None
+    return dt.astimezone(LOCAL_TZ).strftime("%Y-%m-%d %H:%M:%S")
+
+def _parse_remote_timestamp(value):
+    """Converts a remote 'YYYY-MM-DD HH:MM:SS' UTC string to a unix timestamp."""
+    dt = datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+    return dt.replace(tzinfo=timezone.utc).timestamp()
+
+class SyncState:
+    """What the sync path last did, readable by request handlers for free.
+
+    Every update swaps in a new dict, so readers just take the current
+    reference without locking.
+    """
+
+    FIELDS = (
+        'role',                 # 'leader' or 'follower'
+        'generation',           # sync generation being served
+        'last_check',           # when the remote was last asked for updates
+        'last_success',         # when a check last completed without error
+        'last_outcome',         # 'changed', 'unchanged' or 'error'
+        'last_error',
+        'last_error_time',
+        'consecutive_errors',
+        'duration',             # seconds taken by the last check
+        'remote_watermark',     # newest remote table_updates timestamp seen
+        'local_watermark',      # remote timestamp of the data being served
+    )
+
+    # Fields the leader persists for follower processes.
+    SHARED = FIELDS[2:]
+
+    def __init__(self, **fields):
+        self._lock = threading.Lock()
+        self._state = dict.fromkeys(self.FIELDS)
+        self._state['consecutive_errors'] = 0
+        self._state.update(fields)
+
+    def update(self, **fields):
+        with self._lock:
+            state = dict(self._state)
+            state.update(fields)
+            self._state = state
+
+    def get(self):
+        return self._state
+
+class SyncScheduler:
+    """Decides how long the background loop waits before the next remote probe.
+
+    The interval drops to SYNC_MIN_INTERVAL after a change and grows by half
+    on every probe that finds nothing, up to a quarter of the average time
+    between observed changes (at most SYNC_MAX_INTERVAL). Remote errors back
+    off exponentially with jitter.
+    """
+
+    def __init__(self, min_interval=SYNC_MIN_INTERVAL, max_interval=SYNC_MAX_INTERVAL, backoff_max=SYNC_BACKOFF_MAX):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff_max = backoff_max
+        self.interval = min_interval
+        self.failures = 0
+        self.change_interval = None
+        self.last_change = None
+
+    def next_delay(self, outcome, now=None):
+        """Returns the seconds to wait after a sync that ended with `outcome`."""
+        now = time.time() if now is None else now
+
+        if outcome == 'error':
+            self.failures += 1
+            delay = min(self.backoff_max, self.min_interval * 2 ** self.failures)
+            return random.uniform(delay / 2, delay)
+
+        self.failures = 0
+        if outcome == 'changed':
+            if self.last_change is not None:
+                gap = now - self.last_change
+                self.change_interval = gap if self.change_interval is None else 0.7 * self.change_interval + 0.3 * gap
+            self.last_change = now
+            self.interval = self.min_interval
+        else:
+            ceiling = self.max_interval
+            if self.change_interval is not None:
+                ceiling = max(self.min_interval, min(ceiling, self.change_interval / 4))
+            self.interval = min(self.interval * 1.5, ceiling)
+
+        return self.interval * random.uniform(0.9, 1.1)
 
 class CacheManager:
     _instance = None
@@ -27,32 +447,312 @@ class CacheManager:
         return cls._instance
 
     def _init_cache(self):
-        """Initializes the local cache database."""
+        """Initializes the local cache database.
+
+        On the sync leader `conn` is the writer connection and belongs to the
+        sync path; on a follower it is read-only. Request handlers read
+        through `read_pool`.
+        """
+        self._lock_file = None
+        self.is_leader = not MULTI_WORKER or self._try_become_leader()
+        if self.is_leader:
+            self._open_writer()
+        else:
+            self._open_follower()
+
+        self._sync_lock = threading.Lock()
+        self._sync_requested = threading.Event()
+        self._corrupt = threading.Event()
+        self.remote_client_factory = create_remote_client
+        self.scheduler = SyncScheduler()
+        self.last_sync_timings = {}
+        self._persisted_outcome = (None, 0.0)
+        self.generation = 0
+        self.index_snapshot = IndexSnapshot(0, [])
+        self.last_sync = self._read_last_sync()
+        self.state = SyncState(role='leader' if self.is_leader else 'follower', local_watermark=self.last_sync)
+        self.state.update(**self._read_shared_state())
+        self._publish_index_snapshot(self._read_generation())
+        self.read_pool = ReadPool(LOCAL_DB)
+
+        if OFFLINE:
+            print(f"DEBUG: CACHE_OFFLINE is set, serving {LOCAL_DB} without syncing.")
+            return
+        self.sync_thread = threading.Thread(target=self._background_sync_loop, daemon=True)
+        self.sync_thread.start()
+
+    def _open_writer(self):
+        """Opens the writer connection and brings the cache schema up to date.
+
+        Only the process holding the leader lock writes, so a stale cache is
+        emptied in place: followers keep their connections to the same file
+        and see the new schema once it is committed.
+        """
+        rebuild = not self._cache_is_valid()
+        try:
+            self._connect_writer()
+            if rebuild:
+                print("DEBUG: Rebuilding local cache from scratch.")
+                self._drop_cache_objects()
+        except sqlite3.DatabaseError as e:
+            # Not a database any more, so nobody can be reading it.
+            print(f"DEBUG: Replacing unusable cache file: {e}")
+            self.conn.close()
+            self._delete_cache_files()
+            self._connect_writer()
+
+        self.cursor = self.conn.cursor()
+        self._create_tables()
+
+    def _connect_writer(self):
         self.conn = sqlite3.connect(LOCAL_DB, check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row  
+        self.conn.row_factory = sqlite3.Row
 
         self.conn.execute("PRAGMA journal_mode=WAL;")
+        self.conn.create_function("local_time", 1, local_time, deterministic=True)
+
+    def _drop_cache_objects(self):
+        """Drops every view, trigger and table of the cache in one transaction."""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            objects = self.conn.execute("""
+                SELECT type, name FROM sqlite_master
+                WHERE type IN ('view', 'trigger', 'table') AND name NOT LIKE 'sqlite\\_%' ESCAPE '\\'
+                ORDER BY CASE type WHEN 'view' THEN 0 WHEN 'trigger' THEN 1 ELSE 2 END,
+                         sql NOT LIKE 'CREATE VIRTUAL TABLE%'
+            """).fetchall()
+            for kind, name in objects:
+                # Virtual tables take their shadow tables with them.
+                self.conn.execute(f'DROP {kind.upper()} IF EXISTS "{name}"')
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+
+    def _cache_is_valid(self):
+        """Checks whether an existing cache file can be served as is.
 
+        Only the schema version recorded in _metadata is checked, so startup
+        cost does not grow with the cache. Damage further into the file
+        surfaces as a corruption error on a later query, which schedules a
+        rebuild through report_corruption().
+        """
+        if not os.path.exists(LOCAL_DB):
+            return True
+
+        try:
+            conn = sqlite3.connect(LOCAL_DB)
+            try:
+                row = conn.execute("SELECT value FROM _metadata WHERE key = 'schema_version'").fetchone()
+            finally:
+                conn.close()
+        except sqlite3.DatabaseError as e:
+            print(f"DEBUG: Cache unreadable: {e}")
+            return False
+
+        version = row[0] if row else None
+        if version != str(CACHE_SCHEMA_VERSION):
+            print(f"DEBUG: Cache schema version {version} != {CACHE_SCHEMA_VERSION}.")
+            return False
+        return True
+
+    @staticmethod
+    def _delete_cache_files():
+        for f in [LOCAL_DB, LOCAL_DB + '-wal', LOCAL_DB + '-shm']:
+            if os.path.exists(f):
+                os.remove(f)
+
+    def _open_follower(self):
+        """Opens the cache read-only once the leader has created its schema.
+
+        When all workers start together the file or its tables may not exist
+        yet; after FOLLOWER_STARTUP_TIMEOUT the cache is opened as it is and
+        picked up by _follow once the leader publishes.
+        """
+        deadline = time.monotonic() + FOLLOWER_STARTUP_TIMEOUT
+        while True:
+            timed_out = time.monotonic() >= deadline
+            if os.path.exists(LOCAL_DB) or timed_out:
+                self.conn = sqlite3.connect(f"file:{LOCAL_DB}?mode=ro", uri=True, check_same_thread=False)
+                if self._schema_ready():
+                    break
+                if timed_out:
+                    print(f"WARNING: Cache schema not ready after {FOLLOWER_STARTUP_TIMEOUT}s, waiting for the leader.")
+                    break
+                self.conn.close()
+            time.sleep(0.1)
+
+        self.conn.row_factory = sqlite3.Row
         self.cursor = self.conn.cursor()
-        self.last_check_time = 0
-        self._create_tables()
+        self._data_version = None
+        self._file_id = self._cache_file_id()
 
-        self.sync_thread = threading.Thread(target=self._background_sync_loop, daemon=True)
-        self.sync_thread.start()
+    def _schema_ready(self):
+        try:
+            row = self.conn.execute("SELECT value FROM _metadata WHERE key = 'schema_version'").fetchone()
+        except sqlite3.Error:
+            return False
+        return row is not None and row[0] == str(CACHE_SCHEMA_VERSION)
+
+    @staticmethod
+    def _cache_file_id():
+        try:
+            st = os.stat(LOCAL_DB)
+            return (st.st_dev, st.st_ino)
+        except OSError:
+            return None
+
+    def _try_become_leader(self):
+        """Tries to take the leader lock. Only the holder syncs from Turso."""
+        if self._lock_file is None:
+            self._lock_file = open(LEADER_LOCK_FILE, 'a+')
+        return _try_lock(self._lock_file)
+
+    def _follow(self):
+        """Picks up a generation published by the leader process.
+
+        PRAGMA data_version only changes when another connection commits, so
+        the common case costs no query against the tables.
+        """
+        if self._cache_file_id() != self._file_id:
+            print("DEBUG: Cache file was rebuilt by the leader, reopening.")
+            self.conn.close()
+            self._open_follower()
+            self.read_pool.reset()
+
+        version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return
+        self._data_version = version
+
+        generation = self._read_generation()
+        if generation != self.generation:
+            self.last_sync = self._read_last_sync()
+            self._publish_index_snapshot(generation)
+
+        self.state.update(**self._read_shared_state())
 
     def _background_sync_loop(self):
         """Background loop to check for updates and sync."""
         print("DEBUG: Background sync thread started.")
-        while True:
+        while not self.is_leader:
             try:
-                with self._lock:
-                    self.sync_from_turso()
-
-                time.sleep(30)
+                if self._try_become_leader():
+                    print("DEBUG: Took over as sync leader.")
+                    self.conn.close()
+                    self._open_writer()
+                    self.read_pool.reset()
+                    self.is_leader = True
+                    self.state.update(role='leader')
+                    break
+                self._follow()
+            except Exception as e:
+                print(f"ERROR: Follower loop error: {e}")
+            time.sleep(FOLLOWER_POLL_INTERVAL)
 
+        while True:
+            try:
+                self._rebuild_if_corrupt()
+                outcome = self.sync_from_turso()
             except Exception as e:
                 print(f"ERROR: Background sync loop error: {e}")
-                time.sleep(60) 
+                outcome = 'error'
+
+            delay = self.scheduler.next_delay(outcome)
+            print(f"DEBUG: Sync {outcome}, next probe in {delay:.0f}s.")
+
+            if self._wait_for_request(delay):
+                print("DEBUG: Sync requested.")
+            self._sync_requested.clear()
+
+    def report_corruption(self, error):
+        """Schedules a rebuild after a query failed because the cache file is damaged.
+
+        Followers cannot write the file, so they leave REBUILD_REQUEST_FILE
+        for the leader and wake it like request_sync().
+        """
+        if self._corrupt.is_set():
+            return
+        print(f"ERROR: Local cache reported as damaged: {error}")
+        self._corrupt.set()
+        if not self.is_leader:
+            with open(REBUILD_REQUEST_FILE, 'a'):
+                pass
+        self.request_sync()
+
+    def _rebuild_if_corrupt(self):
+        """Replaces a damaged cache file with an empty one before the next sync.
+
+        A report is confirmed with PRAGMA quick_check first, so a stray error
+        never throws away a healthy cache. The next sync then starts from no
+        watermarks and refetches everything. Returns True if the file was
+        replaced.
+        """
+        if not (self._corrupt.is_set() or os.path.exists(REBUILD_REQUEST_FILE)):
+            return False
+
+        with self._sync_lock:
+            try:
+                # A new connection, so no page comes from our own cache.
+                conn = sqlite3.connect(LOCAL_DB)
+                try:
+                    result = conn.execute("PRAGMA quick_check(1)").fetchone()[0]
+                finally:
+                    conn.close()
+            except sqlite3.DatabaseError as e:
+                result = str(e)
+            self._corrupt.clear()
+            try:
+                os.remove(REBUILD_REQUEST_FILE)
+            except OSError:
+                pass
+            if result == 'ok':
+                print("DEBUG: Cache passed quick_check, not rebuilding.")
+                return False
+
+            print(f"ERROR: Cache failed quick_check ({result}), rebuilding from scratch.")
+            self.conn.close()
+            self._delete_cache_files()
+            self._open_writer()
+            self.read_pool.reset()
+            self.last_sync = None
+            return True
+
+    def _wait_for_request(self, timeout):
+        """Sleeps up to `timeout` seconds. Returns True if a sync was requested meanwhile."""
+        if not MULTI_WORKER:
+            return self._sync_requested.wait(timeout)
+
+        # Followers ask for a sync through SYNC_REQUEST_FILE.
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            if self._sync_requested.wait(min(FOLLOWER_POLL_INTERVAL, remaining)):
+                return True
+            if os.path.exists(SYNC_REQUEST_FILE):
+                try:
+                    os.remove(SYNC_REQUEST_FILE)
+                except OSError:
+                    pass
+                return True
+
+    def request_sync(self):
+        """Wakes the sync leader for an immediate sync.
+
+        Requests that arrive before the loop picks one up are coalesced into
+        it. Returns False when the request was coalesced.
+        """
+        if not self.is_leader:
+            coalesced = os.path.exists(SYNC_REQUEST_FILE)
+            with open(SYNC_REQUEST_FILE, 'a'):
+                pass
+            return not coalesced
+
+        coalesced = self._sync_requested.is_set()
+        self._sync_requested.set()
+        return not coalesced
 
     def _create_tables(self):
         """Creates tables in the local cache if they don't exist."""
@@ -98,6 +798,11 @@ class CacheManager:
                 description TEXT,
                 date_start TEXT NOT NULL DEFAULT (datetime ('now', 'localtime')),
                 date_end TEXT NOT NULL DEFAULT (datetime ('now', 'localtime')),
+                ts_start INTEGER,
+                ts_end INTEGER,
+                local_start TEXT,
+                local_end TEXT,
+                store_id INTEGER,
                 FOREIGN KEY (partnership_id) REFERENCES partnerships (id) ON DELETE CASCADE
             )
         """)
@@ -137,6 +842,32 @@ class CacheManager:
             JOIN vw_partnerships vp ON c.partnership_id = vp.partnership_id
         """)
 
+        for table, _, _ in ROLLUPS.values():
+            self.cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    partnership_id INTEGER NOT NULL,
+                    bucket_start INTEGER NOT NULL,
+                    store_id INTEGER,
+                    platform_id INTEGER,
+                    min_global REAL,
+                    max_global REAL,
+                    avg_global REAL,
+                    min_specific REAL,
+                    max_specific REAL,
+                    avg_specific REAL,
+                    covered_seconds INTEGER NOT NULL,
+                    PRIMARY KEY (partnership_id, bucket_start)
+                ) WITHOUT ROWID
+            """)
+
+        # Trigram index over normalize_name(stores.name), rowid = store id.
+        self.cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS stores_fts USING fts5 (
+                name,
+                tokenize = 'trigram'
+            )
+        """)
+
         self.cursor.execute("DROP VIEW IF EXISTS vw_latest_cashbacks")
         self.cursor.execute("""
             CREATE VIEW vw_latest_cashbacks AS
@@ -165,124 +896,645 @@ class CacheManager:
             WHERE rn = 1
         """)
 
+        self._create_indexes()
+
+        self.cursor.execute("INSERT OR REPLACE INTO _metadata (key, value) VALUES ('schema_version', ?)", (str(CACHE_SCHEMA_VERSION),))
+
         self.conn.commit()
 
-    def _should_sync(self):
-        """Checks if the cache needs to be synced."""
+    def _create_indexes(self):
+        """Brings the secondary indexes in line with CACHE_INDEXES."""
+        self.cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx\\_%' ESCAPE '\\'")
+        for row in self.cursor.fetchall():
+            if row[0] not in CACHE_INDEXES:
+                self.cursor.execute(f"DROP INDEX IF EXISTS {row[0]}")
+
+        for sql in CACHE_INDEXES.values():
+            self.cursor.execute(sql)
+
+    def _index_store_names(self):
+        """Rebuilds stores_fts from the stores table; runs inside the publish transaction."""
+        rows = self.cursor.execute("SELECT id, name FROM main.stores").fetchall()
+        self.cursor.execute("DELETE FROM stores_fts")
+        self.cursor.executemany("INSERT INTO stores_fts (rowid, name) VALUES (?, ?)",
+                                [(row[0], normalize_name(row[1])) for row in rows])
+
+    def _record_outcome(self, outcome, started, error=None, timings=None, stats=None):
+        """Updates the sync state after a check and shares it with follower processes."""
+        now = time.time()
+        SYNC_CHECKS.inc(1, outcome)
+        for phase, seconds in (timings or {}).items():
+            SYNC_PHASE_SECONDS.observe(seconds, phase)
+        if stats:
+            SYNC_ROWS.inc(stats['rows'])
+            SYNC_PAGES.inc(stats['pages'])
+        fields = {
+            'last_check': started,
+            'last_outcome': outcome,
+            'duration': now - started,
+            'remote_watermark': getattr(self, 'pending_sync_ts', None),
+            'local_watermark': self.last_sync,
+        }
+        if outcome == 'error':
+            fields['last_error'] = str(error)
+            fields['last_error_time'] = now
+            fields['consecutive_errors'] = self.state.get()['consecutive_errors'] + 1
+        else:
+            fields['last_success'] = now
+            fields['consecutive_errors'] = 0
+        self.state.update(**fields)
+
+        # Probes that keep finding nothing are shared at most every
+        # SYNC_STATE_PERSIST_INTERVAL seconds instead of committing each time.
+        last_outcome, persisted_at = self._persisted_outcome
+        if outcome == 'unchanged' and last_outcome == outcome and now - persisted_at < SYNC_STATE_PERSIST_INTERVAL:
+            return
 
-        self.cursor.execute("SELECT value FROM _metadata WHERE key = 'last_check_time'")
-        row = self.cursor.fetchone()
-        last_check = float(row[0]) if row else 0
+        shared = {key: self.state.get()[key] for key in SyncState.SHARED}
+        try:
+            self.cursor.execute("INSERT OR REPLACE INTO _metadata (key, value) VALUES ('sync_state', ?)", (json.dumps(shared),))
+            self.conn.commit()
+            self._persisted_outcome = (outcome, now)
+        except sqlite3.Error as e:
+            print(f"ERROR: Failed to record sync state: {e}")
+            self.conn.rollback()
 
-        if time.time() - last_check < CACHE_DURATION:
-            return False
+    def _changed_tables(self, update_rows):
+        """Compares the remote table_updates rows with the local watermarks.
 
-        print("DEBUG: Checking for remote updates...")
-        self.cursor.execute("INSERT OR REPLACE INTO _metadata (key, value) VALUES ('last_check_time', ?)", (str(time.time()),))
-        self.conn.commit()
+        `update_rows` are (table_name, updated_at, remote_now) rows, where
+        remote_now is the remote clock at the probe in epoch seconds.
+        Returns {table: watermark} for every table that needs fetching.
+        """
+        watermarks = self._read_watermarks()
+
+        remote_watermarks = {}
+        remote_now = None
+        for table_name, updated_at, now in update_rows:
+            remote_now = float(now)
+            if table_name in STAGED_TABLES:
+                remote_watermarks[table_name] = _parse_remote_timestamp(updated_at) if updated_at else 0.0
+
+        changed = {}
+        for table in STAGED_TABLES:
+            remote_ts = remote_watermarks.get(table, 0.0)
+            if table not in watermarks or remote_ts > watermarks[table]:
+                # updated_at has one-second resolution, so a write later in the
+                # probe's second carries the same stamp as what is fetched now.
+                # Keeping the watermark below that second fetches the table
+                # once more on the next probe. Cashbacks follow the change log.
+                if table != 'cashbacks' and remote_now is not None:
+                    remote_ts = min(remote_ts, remote_now - 1)
+                changed[table] = remote_ts
+
+        print(f"DEBUG: Remote watermarks: {remote_watermarks} vs Local: {watermarks}")
+
+        if changed:
+            self.pending_sync_ts = max(list(remote_watermarks.values()) + list(watermarks.values()) + [0.0])
+        return changed
+
+    def _read_watermarks(self):
+        """Returns the remote updated_at of each table as of its last sync."""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT key, value FROM _metadata WHERE key >= 'watermark:' AND key < 'watermark;'")
+        return {row[0].split(':', 1)[1]: float(row[1]) for row in cursor.fetchall()}
+
+    def sync_from_turso(self):
+        """Syncs data from Turso to local cache.
+
+        One async client probes the remote and then streams every changed
+        table concurrently, page by page, into temp tables without holding
+        any write lock on the cache. Publishing them is a single short
+        transaction, so readers see either the old or the new data and never
+        wait on the network.
+
+        Returns 'changed', 'unchanged' or 'error'.
+        """
+        with self._sync_lock:
+            print("DEBUG: Checking for remote updates...")
+            started = time.time()
 
-        self.cursor.execute("SELECT value FROM _metadata WHERE key = 'last_sync'")
-        row = self.cursor.fetchone()
-        last_sync = float(row[0]) if row else 0
+            timings = {}
+            stats = {'pages': 0, 'rows': 0}
+            start = time.perf_counter()
+            try:
+                result = asyncio.run(self._fetch_remote(timings, stats))
+            except Exception as e:
+                print(f"ERROR: Failed to fetch remote data: {e}")
+                self.conn.rollback()
+                self._record_outcome('error', started, e, stats=stats)
+                return 'error'
+
+            if result is None:
+                try:
+                    if self._extend_rollups():
+                        self._publish_index_snapshot(self.generation + 1)
+                except sqlite3.Error as e:
+                    print(f"ERROR: Failed to extend rollups: {e}")
+                    self.conn.rollback()
+                self._record_outcome('unchanged', started, timings=timings, stats=stats)
+                return 'unchanged'
+            tables, feed = result
+
+            fetch_time = timings['fetch']
+            rate = stats['rows'] / fetch_time if fetch_time > 0 else 0.0
+            print(f"DEBUG: Fetched {stats['rows']} rows in {stats['pages']} pages ({fetch_time:.2f}s, {rate:.0f} rows/s).")
 
+            sync_ts = getattr(self, 'pending_sync_ts', time.time())
+            phase_start = time.perf_counter()
+            try:
+                self._publish_changes(tables, feed, sync_ts)
+            except Exception as e:
+                print(f"ERROR: Failed to sync cache: {e}")
+                self.conn.rollback()
+                if is_corruption_error(e):
+                    self.report_corruption(e)
+                self._record_outcome('error', started, e, stats=stats)
+                return 'error'
+            timings['publish'] = time.perf_counter() - phase_start
+
+            self.last_sync = sync_ts
+
+            phase_start = time.perf_counter()
+            self._publish_index_snapshot(self.generation + 1)
+            timings['snapshot'] = time.perf_counter() - phase_start
+            timings['total'] = time.perf_counter() - start
+
+            self.last_sync_timings = timings
+            self._record_outcome('changed', started, timings=timings, stats=stats)
+            print("DEBUG: Sync complete. Timings: " + ", ".join(f"{phase} {seconds:.3f}s" for phase, seconds in timings.items()))
+            return 'changed'
+
+    async def _fetch_remote(self, timings, stats):
+        """Probes the remote and streams the changed tables into the stage_* temp tables.
+
+        Returns (tables, feed), where feed is the consumed part of the cashback
+        change log (None when cashbacks did not change), or None when the
+        cache is up to date.
+        """
+        phase_start = time.perf_counter()
+        remote_client = self.remote_client_factory()
         try:
-            remote_client = libsql_client.create_client_sync(url=URL, auth_token=TOKEN)
-            rs = remote_client.execute("SELECT MAX(updated_at) FROM table_updates")
-            remote_client.close()
+            updates, log_bounds = await asyncio.gather(
+                remote_client.execute("SELECT table_name, updated_at, CAST(strftime('%s', 'now') AS INTEGER) FROM table_updates"),
+                remote_client.execute("""
+                    SELECT
+                        (SELECT seq FROM sqlite_sequence WHERE name = 'cashback_changes'),
+                        (SELECT MIN(seq) FROM cashback_changes)
+                """),
+                return_exceptions=True,
+            )
+            timings['probe'] = time.perf_counter() - phase_start
+            if isinstance(updates, BaseException):
+                raise updates
 
-            if not rs.rows or not rs.rows[0][0]:
-                if last_sync == 0:
-                    return True
-                return False
+            tables = self._changed_tables(updates.rows)
+            if not tables:
+                return None
 
-            remote_updated_at_str = rs.rows[0][0] 
+            skipped = [table for table in STAGED_TABLES if table not in tables]
+            print(f"DEBUG: Syncing cache from Turso... tables: {list(tables)}, skipped: {skipped}")
 
-            dt = datetime.strptime(remote_updated_at_str, "%Y-%m-%d %H:%M:%S")
-            from datetime import timezone
-            dt = dt.replace(tzinfo=timezone.utc)
-            remote_updated_ts = dt.timestamp()
+            phase_start = time.perf_counter()
+            fetches = [self._stage_table(remote_client, table, stats) for table in ("stores", "platforms", "partnerships") if table in tables]
+            if "cashbacks" in tables:
+                self._reset_stage("cashbacks")
+                fetches.append(self._stage_cashback_changes(remote_client, log_bounds, stats))
 
-            print(f"DEBUG: Remote Last Update: {remote_updated_ts} (Str: {remote_updated_at_str}) vs Local Sync: {last_sync}")
+            results = await asyncio.gather(*fetches)
+            feed = results[-1] if "cashbacks" in tables else None
+            timings['fetch'] = time.perf_counter() - phase_start
+        finally:
+            await remote_client.close()
 
-            if remote_updated_ts > last_sync:
-                self.pending_sync_ts = remote_updated_ts
-                return True
+        self.conn.commit()
+        return tables, feed
 
-            return False
+    async def _fetch_pages(self, remote_client, table, stats, columns="*", where=None, params=(), key="id"):
+        """Yields remote rows of `table` in pages, using keyset pagination on `key`.
 
-        except Exception as e:
-            print(f"ERROR: Failed to check remote updates: {e}")
+        `key` must be the first selected column.
+        """
+        last_key = None
+        while True:
+            clauses = [where] if where else []
+            page_params = list(params)
+            if last_key is not None:
+                clauses.append(f"{key} > ?")
+                page_params.append(last_key)
+
+            query = f"SELECT {columns} FROM {table}"
+            if clauses:
+                query += " WHERE " + " AND ".join(clauses)
+            query += f" ORDER BY {key} LIMIT {SYNC_PAGE_SIZE}"
+
+            rows = (await remote_client.execute(query, page_params)).rows
+            stats['pages'] += 1
+            stats['rows'] += len(rows)
+            if rows:
+                yield rows
+
+            if len(rows) < SYNC_PAGE_SIZE:
+                return
+            last_key = rows[-1][0]
+
+    async def _stage_table(self, remote_client, table, stats):
+        self._reset_stage(table)
+        async for rows in self._fetch_pages(remote_client, table, stats):
+            self._stage_rows(table, rows)
+
+    def _reset_stage(self, table):
+        """Creates or empties the temp table that only the writer connection can see."""
+        columns = STAGED_TABLES[table]
+        self.cursor.execute(f"CREATE TEMP TABLE IF NOT EXISTS stage_{table} AS SELECT {columns} FROM main.{table} WHERE 0")
+        self.cursor.execute(f"DELETE FROM temp.stage_{table}")
+
+    def _stage_rows(self, table, rows):
+        columns = STAGED_TABLES[table]
+        placeholders = ", ".join(["?"] * len(columns.split(",")))
+        self.cursor.executemany(f"INSERT INTO temp.stage_{table} ({columns}) VALUES ({placeholders})", rows)
+
+    async def _stage_cashback_changes(self, remote_client, log_bounds, stats):
+        """Applies the remote cashback_changes log from the last applied sequence number.
+
+        The log entries and the current version of the rows they touch are
+        read concurrently. Falls back to downloading every cashback when the
+        cache has never read the log or the entries it needs have been pruned.
+        """
+        last_seq = self._read_cdc_seq()
+
+        if isinstance(log_bounds, BaseException):
+            print(f"WARNING: Cashback change log unavailable, doing a full cashback resync: {log_bounds}")
+            async for rows in self._fetch_pages(remote_client, "cashbacks", stats):
+                self._stage_rows("cashbacks", rows)
+            return {'full': True, 'deletes': [], 'seq': None}
+
+        head_seq = log_bounds.rows[0][0] or 0
+        oldest_seq = log_bounds.rows[0][1]
+
+        truncated = head_seq > (last_seq or 0) and (oldest_seq is None or oldest_seq > (last_seq or 0) + 1)
+        if last_seq is None or truncated:
+            print(f"DEBUG: Full cashback resync (local seq {last_seq}, remote log {oldest_seq}..{head_seq}).")
+            async for rows in self._fetch_pages(remote_client, "cashbacks", stats):
+                self._stage_rows("cashbacks", rows)
+            return {'full': True, 'deletes': [], 'seq': head_seq}
+
+        if head_seq == last_seq:
+            return {'full': False, 'deletes': [], 'seq': head_seq}
+
+        log_range = "seq > ? AND seq <= ?"
+        changed_ids = set()
+        found = set()
+
+        async def read_log():
+            async for log in self._fetch_pages(remote_client, "cashback_changes", stats, "seq, cashback_id", log_range, [last_seq, head_seq], key="seq"):
+                changed_ids.update(row[1] for row in log)
+
+        async def read_rows():
+            # Rows are read after head_seq was taken, so they are at least as new as the log.
+            where = f"id IN (SELECT cashback_id FROM cashback_changes WHERE {log_range})"
+            async for rows in self._fetch_pages(remote_client, "cashbacks", stats, where=where, params=[last_seq, head_seq]):
+                self._stage_rows("cashbacks", rows)
+                found.update(row[0] for row in rows)
+
+        await asyncio.gather(read_log(), read_rows())
+
+        # A changed row that no longer exists has been deleted.
+        deletes = sorted(changed_ids - found)
+
+        print(f"DEBUG: Consumed cashback changes {last_seq}..{head_seq}: {len(found)} upserts, {len(deletes)} deletes.")
+        return {'full': False, 'deletes': deletes, 'seq': head_seq}
+
+    def _rollup_rows(self, deleted_ids=()):
+        """Returns {id: (partnership_id, ts_start, ts_end, value_global, value_specific)}
+        of the cached rows that are staged for upsert or listed in `deleted_ids`."""
+        query = "SELECT id, partnership_id, ts_start, ts_end, value_global, value_specific FROM main.cashbacks WHERE id IN ({})"
+        rows = self.cursor.execute(query.format("SELECT id FROM temp.stage_cashbacks")).fetchall()
+
+        deleted_ids = list(deleted_ids)
+        for i in range(0, len(deleted_ids), 500):
+            chunk = deleted_ids[i:i + 500]
+            rows += self.cursor.execute(query.format(",".join("?" * len(chunk))), chunk).fetchall()
+
+        return {row[0]: tuple(row[1:]) for row in rows}
+
+    def _update_rollups(self, old_rows):
+        """Brings the rollup tables up to date after the cashback delta was applied.
+
+        `old_rows` are the cached rows replaced or deleted by the delta
+        (see _rollup_rows); None rebuilds every rollup. Besides the spans of
+        those rows, offers still running past the previous horizon (the time
+        of the last publish) are rolled up to now. Returns the number of
+        partnerships refreshed.
+        """
+        row = self.cursor.execute("SELECT value FROM _metadata WHERE key = 'rollup_horizon'").fetchone()
+        previous = int(float(row[0])) if row and old_rows is not None else 0
+        horizon = int(time.time())
+
+        spans = {}
+        def touch(partnership_id, lo, hi):
+            if lo is not None and hi is not None and lo < hi:
+                spans.setdefault(partnership_id, []).append((lo, hi))
+
+        if old_rows is None:
+            for table, _, _ in ROLLUPS.values():
+                self.cursor.execute(f"DELETE FROM {table}")
+            for pid, lo, hi in self.cursor.execute("SELECT partnership_id, MIN(ts_start), MAX(ts_end) FROM cashbacks GROUP BY partnership_id").fetchall():
+                touch(pid, lo, hi)
+        else:
+            new_rows = self._rollup_rows()
+            for cashback_id, old in old_rows.items():
+                new = new_rows.get(cashback_id)
+                if new is not None and new[0] == old[0] and new[1] == old[1] and new[3:] == old[3:]:
+                    # Same offer with a moved end: only the days between both ends change.
+                    touch(old[0], min(old[2], new[2]), max(old[2], new[2]))
+                else:
+                    touch(old[0], old[1], old[2])
+            for cashback_id, new in new_rows.items():
+                old = old_rows.get(cashback_id)
+                if old is None or not (new[0] == old[0] and new[1] == old[1] and new[3:] == old[3:]):
+                    touch(new[0], new[1], new[2])
+
+            for pid, lo, hi in self.cursor.execute("SELECT partnership_id, ts_start, ts_end FROM cashbacks WHERE ts_end > ?", (previous,)).fetchall():
+                touch(pid, max(lo, previous), hi)
+
+        buckets = 0
+        for partnership_id, intervals in spans.items():
+            for table, period, origin in ROLLUPS.values():
+                buckets += self._refresh_rollup(table, period, origin, partnership_id, intervals, horizon)
+
+        self.cursor.execute("INSERT OR REPLACE INTO _metadata (key, value) VALUES ('rollup_horizon', ?)", (str(horizon),))
+        print(f"DEBUG: Refreshed {buckets} rollup buckets for {len(spans)} partnerships.")
+        return len(spans)
+
+    def _extend_rollups(self):
+        """Rolls the offers still running up to now after a check without changes.
+
+        Runs at most every ROLLUP_EXTEND_INTERVAL seconds. Returns True when
+        it published a new generation.
+        """
+        row = self.cursor.execute("SELECT value FROM _metadata WHERE key = 'rollup_horizon'").fetchone()
+        if row is None or time.time() - float(row[0]) < ROLLUP_EXTEND_INTERVAL:
             return False
 
-    def sync_from_turso(self):
-        """Syncs data from Turso to local cache."""
-        if not self._should_sync():
-            return
+        self.cursor.execute("BEGIN IMMEDIATE")
+        extended = self._update_rollups({}) > 0
+        if extended:
+            self.cursor.execute("INSERT OR REPLACE INTO _metadata (key, value) VALUES ('generation', ?)", (str(self.generation + 1),))
+        self.conn.commit()
+        return extended
+
+    def _refresh_rollup(self, table, period, origin, partnership_id, intervals, horizon):
+        """Recomputes the buckets of one partnership that overlap `intervals`, up to `horizon`."""
+        ranges = []
+        for lo, hi in sorted(intervals):
+            hi = min(hi, horizon)
+            if lo >= hi:
+                continue
+            start = lo - (lo - origin) % period
+            end = (hi - 1) - (hi - 1 - origin) % period + period
+            if ranges and start <= ranges[-1][1]:
+                ranges[-1][1] = max(ranges[-1][1], end)
+            else:
+                ranges.append([start, end])
+
+        owner = self.cursor.execute("SELECT store_id, platform_id FROM partnerships WHERE id = ?", (partnership_id,)).fetchone()
+        store_id, platform_id = owner if owner else (None, None)
+
+        written = 0
+        for start, end in ranges:
+            self.cursor.execute(f"DELETE FROM {table} WHERE partnership_id = ? AND bucket_start >= ? AND bucket_start < ?", (partnership_id, start, end))
+            limit = min(end, horizon)
+
+            # bucket -> [min_g, max_g, weighted_g, min_s, max_s, weighted_s, seconds]
+            acc = {}
+            rows = self.cursor.execute(
+                "SELECT ts_start, ts_end, value_global, value_specific FROM cashbacks WHERE partnership_id = ? AND ts_start < ? AND ts_end > ?",
+                (partnership_id, limit, start)).fetchall()
+            for ts_start, ts_end, value, specific in rows:
+                if specific is None or specific < value:
+                    specific = value
+                lo = max(ts_start, start)
+                hi = min(ts_end, limit)
+                bucket = lo - (lo - origin) % period
+                while bucket < hi:
+                    seconds = min(hi, bucket + period) - max(lo, bucket)
+                    if seconds > 0:
+                        a = acc.get(bucket)
+                        if a is None:
+                            acc[bucket] = [value, value, value * seconds, specific, specific, specific * seconds, seconds]
+                        else:
+                            a[0] = min(a[0], value)
+                            a[1] = max(a[1], value)
+                            a[2] += value * seconds
+                            a[3] = min(a[3], specific)
+                            a[4] = max(a[4], specific)
+                            a[5] += specific * seconds
+                            a[6] += seconds
+                    bucket += period
+
+            self.cursor.executemany(
+                f"INSERT INTO {table} (partnership_id, bucket_start, store_id, platform_id, min_global, max_global, avg_global, min_specific, max_specific, avg_specific, covered_seconds) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(partnership_id, bucket, store_id, platform_id, a[0], a[1], a[2] / a[6], a[3], a[4], a[5] / a[6], a[6]) for bucket, a in acc.items()])
+            written += len(acc)
+        return written
+
+    def _copy_partnership_columns(self):
+        """Refreshes the store and platform copied from partnerships onto
+        cashbacks and rollup buckets, after the partnerships were replaced.
+
+        Rows of a partnership that no longer exists get NULLs, so they drop
+        out of the per-store reads like they did from the join.
+        """
+        updated = self.cursor.execute("""
+            UPDATE main.cashbacks SET store_id = (SELECT store_id FROM main.partnerships WHERE id = cashbacks.partnership_id)
+            WHERE store_id IS NOT (SELECT store_id FROM main.partnerships WHERE id = cashbacks.partnership_id)
+        """).rowcount
+        for table, _, _ in ROLLUPS.values():
+            updated += self.cursor.execute(f"""
+                UPDATE main.{table} SET (store_id, platform_id) = (SELECT store_id, platform_id FROM main.partnerships WHERE id = {table}.partnership_id)
+                WHERE (store_id, platform_id) IS NOT (SELECT store_id, platform_id FROM main.partnerships WHERE id = {table}.partnership_id)
+            """).rowcount
+        if updated:
+            print(f"DEBUG: Moved {updated} cashback and rollup rows to their new store or platform.")
+
+    def _read_cdc_seq(self):
+        """Returns the last applied cashback_changes sequence number, or None."""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT value FROM _metadata WHERE key = 'cdc_seq'")
+        row = cursor.fetchone()
+        return int(row[0]) if row else None
+
+    def _publish_changes(self, tables, feed, sync_ts):
+        """Swaps the staged rows into the cache in one transaction and advances the watermarks."""
+        self.cursor.execute("BEGIN IMMEDIATE")
+
+        for table in ("stores", "platforms", "partnerships"):
+            if table in tables:
+                columns = STAGED_TABLES[table]
+                self.cursor.execute(f"DELETE FROM main.{table}")
+                self.cursor.execute(f"INSERT INTO main.{table} ({columns}) SELECT {columns} FROM temp.stage_{table}")
+
+        if "stores" in tables:
+            self._index_store_names()
+        if "partnerships" in tables:
+            self._copy_partnership_columns()
+
+        if feed is not None:
+            old_rows = {} if feed['full'] else self._rollup_rows(feed['deletes'])
+
+            if feed['full']:
+                self.cursor.execute("DELETE FROM main.cashbacks")
+
+            # Epoch and local-time copies of the dates, and the store of the
+            # partnership, are computed once here so reads never parse
+            # timestamps or sort a store's offers.
+            columns = STAGED_TABLES['cashbacks']
+            self.cursor.execute(f"""
+                INSERT OR REPLACE INTO main.cashbacks ({columns}, ts_start, ts_end, local_start, local_end, store_id)
+                SELECT {columns},
+                    CAST(strftime('%s', date_start) AS INTEGER), CAST(strftime('%s', date_end) AS INTEGER),
+                    local_time(date_start), local_time(date_end),
+                    (SELECT store_id FROM main.partnerships WHERE id = partnership_id)
+                FROM temp.stage_cashbacks
+            """)
+            if self.cursor.rowcount > 0:
+                print(f"DEBUG: Inserted/Updated {self.cursor.rowcount} cashbacks.")
+            else:
+                print("DEBUG: No new cashbacks found.")
 
-        print("DEBUG: Syncing cache from Turso...")
-        try:
-            self.cursor.execute("SELECT MAX(id) FROM cashbacks")
-            row = self.cursor.fetchone()
-            max_local_id = row[0] if row and row[0] is not None else 0
+            if feed['deletes']:
+                self.cursor.executemany("DELETE FROM main.cashbacks WHERE id = ?", [(i,) for i in feed['deletes']])
+                print(f"DEBUG: Deleted {len(feed['deletes'])} cashbacks.")
 
-            # Get the IDs of the latest cashbacks we know about
-            self.cursor.execute("SELECT cashback_id FROM vw_latest_cashbacks")
-            active_cashback_ids = [str(r[0]) for r in self.cursor.fetchall()]
+            if feed['seq'] is not None:
+                self.cursor.execute("INSERT OR REPLACE INTO _metadata (key, value) VALUES ('cdc_seq', ?)", (str(feed['seq']),))
+            else:
+                self.cursor.execute("DELETE FROM _metadata WHERE key = 'cdc_seq'")
 
-            print(f"DEBUG: Fetching new cashbacks from ID > {max_local_id} AND {len(active_cashback_ids)} currently active cashbacks.")
+            self._update_rollups(None if feed['full'] else old_rows)
+        else:
+            self._update_rollups({})
 
-            remote_client = libsql_client.create_client_sync(url=URL, auth_token=TOKEN)
+        for table, remote_ts in tables.items():
+            self.cursor.execute("INSERT OR REPLACE INTO _metadata (key, value) VALUES (?, ?)", (f"watermark:{table}", str(remote_ts)))
+        self.cursor.execute("INSERT OR REPLACE INTO _metadata (key, value) VALUES ('last_sync', ?)", (str(sync_ts),))
+        self.cursor.execute("INSERT OR REPLACE INTO _metadata (key, value) VALUES ('generation', ?)", (str(self.generation + 1),))
 
-            stores = remote_client.execute("SELECT * FROM stores").rows
-            platforms = remote_client.execute("SELECT * FROM platforms").rows
-            partnerships = remote_client.execute("SELECT * FROM partnerships").rows
+        self.conn.commit()
 
-            if active_cashback_ids:
-                # libsql_client driver accepts position parameters, we need to pass a list
-                placeholders = ",".join(["?"] * len(active_cashback_ids))
-                query = f"SELECT * FROM cashbacks WHERE id > ? OR id IN ({placeholders})"
-                params = [max_local_id] + active_cashback_ids
-                cashbacks = remote_client.execute(query, params).rows
-            else:
-                cashbacks = remote_client.execute("SELECT * FROM cashbacks WHERE id > ?", [max_local_id]).rows
+    def _load_stores_with_all_cashbacks(self):
+        """Runs the index page query and groups the latest offers per store."""
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT 
+                s.id as store_id, 
+                s.name as store_name, 
+                s.url as store_url, 
+                c.value_global as value,
+                c.value_specific,
+                p.id as platform_id,
+                p.name as platform_name
+            FROM partnerships pa
+            JOIN stores s ON s.id = pa.store_id
+            JOIN platforms p ON p.id = pa.platform_id
+            JOIN cashbacks c ON c.id = (
+                SELECT lc.id FROM cashbacks lc
+                WHERE lc.partnership_id = pa.id
+                ORDER BY lc.date_start DESC, lc.id DESC
+                LIMIT 1
+            )
+        """)
 
-            remote_client.close()
+        stores_map = {}
+        for row in cursor.fetchall():
+            store_id = row[0]
+            if store_id not in stores_map:
+                stores_map[store_id] = {
+                    'id': row[0],
+                    'name': row[1],
+                    'url': row[2],
+                    'offers': []
+                }
 
-            self.cursor.execute("BEGIN TRANSACTION")
+            stores_map[store_id]['offers'].append({
+                'platform_id': row[5],
+                'platform_name': row[6],
+                'value': row[3],
+                'value_specific': row[4]
+            })
 
-            self.cursor.execute("DELETE FROM partnerships")
-            self.cursor.execute("DELETE FROM platforms")
-            self.cursor.execute("DELETE FROM stores")
+        results = []
+        for store in stores_map.values():
+            if not store['offers']:
+                continue
 
-            self.cursor.executemany("INSERT INTO stores (id, name, url) VALUES (?, ?, ?)", stores)
-            self.cursor.executemany("INSERT INTO platforms (id, name, url) VALUES (?, ?, ?)", platforms)
-            self.cursor.executemany("INSERT INTO partnerships (id, store_id, platform_id, url) VALUES (?, ?, ?, ?)", partnerships)
+            store['offers'].sort(key=lambda x: x['value'], reverse=True)
+            store['max_cashback'] = store['offers'][0]['value']
+            store['platform_name'] = store['offers'][0]['platform_name'] 
+            results.append(store)
 
-            if cashbacks:
-                self.cursor.executemany("INSERT OR REPLACE INTO cashbacks (id, partnership_id, value_global, value_specific, description, date_start, date_end) VALUES (?, ?, ?, ?, ?, ?, ?)", cashbacks)
-                print(f"DEBUG: Inserted/Updated {len(cashbacks)} cashbacks.")
-            else:
-                print("DEBUG: No new cashbacks found.")
+        results.sort(key=lambda x: x['max_cashback'], reverse=True)
+        return results
 
-            sync_ts = getattr(self, 'pending_sync_ts', time.time())
-            self.cursor.execute("INSERT OR REPLACE INTO _metadata (key, value) VALUES ('last_sync', ?)", (str(sync_ts),))
+    def _publish_index_snapshot(self, generation):
+        """Materializes the index page result and swaps it in for readers.
 
-            self.conn.commit()
-            print("DEBUG: Sync complete.")
+        The generation only advances after the snapshot is in place, so
+        anything keyed on the generation never pairs it with older data.
+        """
+        try:
+            stores = self._load_stores_with_all_cashbacks()
+            self.index_snapshot = IndexSnapshot(generation, stores)
+            print(f"DEBUG: Published index snapshot generation {generation} with {len(stores)} stores.")
         except Exception as e:
-            print(f"ERROR: Failed to sync cache: {e}")
-            self.conn.rollback()
+            print(f"ERROR: Failed to build index snapshot: {e}")
+
+        self.generation = generation
+        self.state.update(generation=generation)
+
+    def _read_metadata(self, key):
+        """Returns a _metadata value, or None. A follower may look before the leader created the table."""
+        try:
+            row = self.conn.execute("SELECT value FROM _metadata WHERE key = ?", (key,)).fetchone()
+        except sqlite3.OperationalError:
+            return None
+        return row[0] if row else None
+
+    def _read_generation(self):
+        """Returns the generation last published to the cache file."""
+        value = self._read_metadata('generation')
+        return int(value) if value else 0
+
+    def _read_shared_state(self):
+        """Returns the sync state fields last persisted by the leader."""
+        value = self._read_metadata('sync_state')
+        try:
+            return json.loads(value) if value else {}
+        except ValueError:
+            return {}
+
+    def _read_last_sync(self):
+        """Returns the remote update timestamp of the cached data, or None."""
+        value = self._read_metadata('last_sync')
+        return float(value) if value else None
+
+    def get_index_snapshot(self):
+        """Returns the current index snapshot. Readers never touch SQLite."""
+        return self.index_snapshot
 
     def get_connection(self):
         """Returns the local sqlite connection, syncing if necessary."""
 
         return self.conn
 
+    def get_read_client(self):
+        """Returns a client over a pooled read-only connection. Close it to give it back."""
+        return LocalClientWrapper(self.read_pool.acquire(), self.read_pool)
+
     def get_last_sync_time(self):
         """Returns the last check timestamp as a float or None."""
-        self.cursor.execute("SELECT value FROM _metadata WHERE key = 'last_check_time'")
-        row = self.cursor.fetchone()
-        return float(row['value']) if row else None
+        return self.state.get()['last_check']
 
 cache_manager = CacheManager()
 
@@ -291,110 +1543,233 @@ def get_client():
 
     return cache_manager.get_connection()
 
+def request_sync():
+    """Asks the background loop to sync now. Returns False if coalesced with a pending request."""
+    return cache_manager.request_sync()
+
+def get_read_client():
+    """Returns a read-only client from the cache's connection pool."""
+
+    return cache_manager.get_read_client()
+
+def get_pool_stats():
+    return cache_manager.read_pool.stats()
+
 def get_last_sync_time():
     return cache_manager.get_last_sync_time()
 
+def get_sync_state():
+    """Returns the current SyncState fields as a dict that must not be modified."""
+    return cache_manager.state.get()
+
+def get_sync_generation():
+    """Returns a counter that changes every time the cached data changes."""
+    return cache_manager.generation
+
+def get_last_modified_time():
+    """Returns the remote update timestamp of the cached data, or None."""
+    return cache_manager.last_sync
+
+@metrics.register_collector
+def _collect_cache_metrics():
+    pool = get_pool_stats()
+    yield "cache_read_pool_connections", "gauge", "Read pool connections by state.", [
+        ({'state': 'idle'}, pool['idle']),
+        ({'state': 'in_use'}, pool['size'] - pool['idle']),
+    ]
+    yield "cache_read_pool_checkouts_total", "counter", "Read pool checkouts.", [({}, pool['checkouts'])]
+    yield "cache_read_pool_waits_total", "counter", "Read pool checkouts that had to wait for a connection.", [({}, pool['waits'])]
+    yield "cache_read_pool_wait_seconds_total", "counter", "Time spent waiting for a read pool connection.", [({}, pool['wait_time_total'])]
+
+    info = local_time.cache_info()
+    yield "local_time_cache_lookups_total", "counter", "local_time() memo lookups by result.", [
+        ({'result': 'hit'}, info.hits),
+        ({'result': 'miss'}, info.misses),
+    ]
+
+    state = get_sync_state()
+    yield "sync_generation", "gauge", "Index snapshot generation served by this process.", [({}, state['generation'])]
+    yield "sync_last_success_timestamp_seconds", "gauge", "Unix time of the last successful sync check.", [({}, state['last_success'])]
+    yield "sync_consecutive_errors", "gauge", "Failed sync checks since the last success.", [({}, state['consecutive_errors'])]
+
+def explain_query_plan(conn, query, params=()):
+    """Returns the EXPLAIN QUERY PLAN of `query` as indented lines."""
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in conn.execute("EXPLAIN QUERY PLAN " + query, params).fetchall():
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[node_id] + detail)
+    return lines
+
+_query_trace = threading.local()
+
+def start_query_trace():
+    """Starts recording (name, seconds, rows) of every query run by this thread."""
+    _query_trace.queries = []
+
+def stop_query_trace():
+    """Stops recording and returns the queries recorded since start_query_trace()."""
+    queries = getattr(_query_trace, 'queries', None) or []
+    _query_trace.queries = None
+    return queries
+
 class LocalResultSet:
     def __init__(self, rows):
         self.rows = rows
 
 class LocalClientWrapper:
-    def __init__(self, connection):
+    def __init__(self, connection, pool=None):
         self.conn = connection
+        self.pool = pool
 
-    def execute(self, query, params=()):
+    def execute(self, query, params=(), name='other'):
+        """Runs `query` and records its time and row count under `name`."""
         cursor = self.conn.cursor()
         try:
+            start = time.perf_counter()
             cursor.execute(query, params)
             rows = cursor.fetchall()
-            return LocalResultSet(rows)
+            elapsed = time.perf_counter() - start
         except Exception as e:
             print(f"Query Error: {e}")
+            if is_corruption_error(e):
+                cache_manager.report_corruption(e)
             raise
 
+        QUERY_SECONDS.observe(elapsed, name)
+        QUERY_ROWS.inc(len(rows), name)
+        trace = getattr(_query_trace, 'queries', None)
+        if trace is not None:
+            trace.append((name, elapsed, len(rows)))
+        if 0 <= SLOW_QUERY_SECONDS <= elapsed:
+            self._log_slow_query(name, query, params, elapsed, len(rows))
+        return LocalResultSet(rows)
+
+    def _log_slow_query(self, name, query, params, elapsed, row_count):
+        SLOW_QUERIES.inc(1, name)
+        try:
+            plan = explain_query_plan(self.conn, query, params)
+        except sqlite3.Error as e:
+            plan = [f"(EXPLAIN failed: {e})"]
+        shown_params = repr(list(params))
+        if len(shown_params) > 200:
+            shown_params = shown_params[:200] + "...]"
+        print(f"WARNING: Slow query {name} took {elapsed * 1000:.1f}ms ({row_count} rows)\n"
+              f"  SQL: {' '.join(query.split())}\n"
+              f"  Params: {shown_params}\n"
+              f"  Plan:\n" + "\n".join("    " + line for line in plan))
+
     def close(self):
 
-        pass
+        if self.pool is not None:
+            self.pool.release(self.conn)
+            self.pool = None
 
 def get_stores_with_all_cashbacks(search_query=None):
+    """Returns the stores of the current index snapshot, optionally filtered by name.
 
-    raw_conn = get_client()
-    client = LocalClientWrapper(raw_conn)
-
-    try:
-
-        base_query = """
-            WITH LatestCashbacks AS (
-                SELECT 
-                    s.id as store_id, 
-                    s.name as store_name, 
-                    s.url as store_url, 
-                    c.value_global as value,
-                    c.value_specific,
-                    p.id as platform_id,
-                    p.name as platform_name,
-                    ROW_NUMBER() OVER (PARTITION BY s.id, p.id ORDER BY c.date_start DESC) as rn
-                FROM stores s
-                JOIN partnerships pa ON s.id = pa.store_id
-                JOIN cashbacks c ON pa.id = c.partnership_id
-                JOIN platforms p ON pa.platform_id = p.id
-        """
+    The returned dicts are shared between requests and must not be modified.
+    """
+    snapshot = cache_manager.get_index_snapshot()
 
-        params = []
-        middle_query = ""
-        if search_query:
-            middle_query = " WHERE s.name LIKE ?"
-            params.append(f"%{search_query}%")
+    if not search_query:
+        return snapshot.stores
 
-        final_query = """
-            )
-            SELECT store_id, store_name, store_url, value, value_specific, platform_id, platform_name 
-            FROM LatestCashbacks 
-            WHERE rn = 1
-        """
-
-        query = base_query + middle_query + final_query
+    matches = search_store_ids(search_query)
+    return [store for store in snapshot.stores if store['id'] in matches]
 
-        rs = client.execute(query, params)
-
-        stores_map = {}
-        for row in rs.rows:
-            store_id = row[0]
-            if store_id not in stores_map:
-                stores_map[store_id] = {
-                    'id': row[0],
-                    'name': row[1],
-                    'url': row[2],
-                    'offers': []
-                }
+def search_store_ids(search_query):
+    """Finds stores whose name contains `search_query`, ignoring case and accents.
 
-            stores_map[store_id]['offers'].append({
-                'platform_id': row[5],
-                'platform_name': row[6],
-                'value': row[3],
-                'value_specific': row[4]
-            })
-
-        results = []
-        for store in stores_map.values():
-            if not store['offers']:
-                continue
-
-            store['offers'].sort(key=lambda x: x['value'], reverse=True)
-            store['max_cashback'] = store['offers'][0]['value']
-            store['platform_name'] = store['offers'][0]['platform_name'] 
-            results.append(store)
+    Returns {store_id: rank}; lower ranks are better: names starting with the
+    query, then a word starting with it, then any substring, earlier and
+    shorter names first.
+    """
+    needle = normalize_name(search_query.strip())
+    if not needle:
+        return {}
 
-        results.sort(key=lambda x: x['max_cashback'], reverse=True)
-        return results
-    finally:
-        client.close()
+    if len(needle) >= 3:
+        client = get_read_client()
+        try:
+            # Trigram phrase query; embedded quotes are doubled.
+            rs = client.execute("SELECT rowid, name FROM stores_fts WHERE stores_fts MATCH ?", ['"' + needle.replace('"', '""') + '"'], name='store_search')
+            rows = [(row[0], row[1]) for row in rs.rows]
+        finally:
+            client.close()
+    else:
+        # Too short for a trigram lookup; the listed stores are filtered in memory.
+        snapshot = cache_manager.get_index_snapshot()
+        rows = [(store['id'], name) for name, store in zip(snapshot.search_names, snapshot.stores) if needle in name]
+
+    scored = []
+    for store_id, name in rows:
+        position = name.find(needle)
+        if position < 0:
+            continue
+        if position == 0:
+            kind = 0
+        elif not name[position - 1].isalnum():
+            kind = 1
+        else:
+            kind = 2
+        scored.append(((kind, position, len(name), name), store_id))
+
+    scored.sort()
+    return {store_id: rank for rank, (_, store_id) in enumerate(scored)}
+
+def search_stores(search_query=None, platform_ids=None, mode='global', sort='cashback-desc', page=1, page_size=STORES_PAGE_SIZE):
+    """Best offer per store for the index page and /api/stores.
+
+    A store's value is its best offer among `platform_ids` (all platforms if
+    empty), using value_specific when it is higher in 'max' mode. Stores
+    without such an offer are left out. Returns (total, page of stores).
+    """
+    snapshot = cache_manager.get_index_snapshot()
+    ranked = snapshot.ranking(platform_ids, mode, sort)
+
+    if search_query:
+        matches = search_store_ids(search_query)
+        ranked = [r for r in ranked if r[1]['id'] in matches]
+        if sort == 'relevance':
+            ranked.sort(key=lambda r: matches[r[1]['id']])
+
+    start = (page - 1) * page_size
+    results = []
+    for _, store, platform_id, value in ranked[start:start + page_size]:
+        results.append({
+            'id': store['id'],
+            'name': store['name'],
+            'url': store['url'],
+            'max_cashback': value,
+            'platform_id': platform_id,
+            'platform_name': snapshot.matrix.platform_names[platform_id],
+        })
+    return len(ranked), results
+
+def get_best_offers(platform_ids=None, mode='global', limit=None):
+    """Top stores by best offer among `platform_ids` (all if empty), answered
+    from the snapshot's offer matrix. Returns dicts ordered by value."""
+    snapshot = cache_manager.get_index_snapshot()
+    matrix = snapshot.matrix
+    values, platforms = matrix.best(platform_ids, mode)
+
+    results = []
+    for r in matrix.top(values, limit):
+        platform_id = platforms[r]
+        results.append({
+            'store_id': snapshot.stores[r]['id'],
+            'name': snapshot.stores[r]['name'],
+            'value': values[r],
+            'platform_id': platform_id,
+            'platform_name': matrix.platform_names[platform_id],
+        })
+    return results
 
 def get_store_details(store_id):
-    raw_conn = get_client()
-    client = LocalClientWrapper(raw_conn)
+    client = get_read_client()
     try:
-        store_rs = client.execute("SELECT * FROM stores WHERE id = ?", [store_id])
+        store_rs = client.execute("SELECT * FROM stores WHERE id = ?", [store_id], name='store')
         if not store_rs.rows:
             return None
 
@@ -406,22 +1781,21 @@ def get_store_details(store_id):
                 c.description,
                 c.date_end,
                 c.date_start,
+                c.local_end,
+                c.local_start,
                 pa.url as partnership_url
             FROM partnerships pa
             JOIN platforms p ON pa.platform_id = p.id
-            JOIN cashbacks c ON pa.id = c.partnership_id
+            JOIN cashbacks c ON c.id = (
+                SELECT lc.id FROM cashbacks lc
+                WHERE lc.partnership_id = pa.id
+                ORDER BY lc.date_start DESC, lc.id DESC
+                LIMIT 1
+            )
             WHERE pa.store_id = ?
-            ORDER BY c.date_start DESC
-        """, [store_id])
-
-        unique_cashbacks = {}
-        for row in cashbacks_rs.rows:
-
-            p_name = row['platform_name']
-            if p_name not in unique_cashbacks:
-                unique_cashbacks[p_name] = row
+        """, [store_id], name='store_offers')
 
-        final_cashbacks = list(unique_cashbacks.values())
+        final_cashbacks = list(cashbacks_rs.rows)
         final_cashbacks.sort(key=lambda x: x['value'], reverse=True)
 
         return {
@@ -432,17 +1806,67 @@ def get_store_details(store_id):
         client.close()
 
 def get_platforms():
-    raw_conn = get_client()
-    client = LocalClientWrapper(raw_conn)
+    client = get_read_client()
     try:
-        rs = client.execute("SELECT * FROM platforms ORDER BY name")
+        rs = client.execute("SELECT * FROM platforms ORDER BY name", name='platforms')
+        return rs.rows
+    finally:
+        client.close()
+
+def get_cashback_rollups(store_id, resolution, start_ts=None, end_ts=None, platform_ids=None):
+    """Returns the store's 'daily' or 'weekly' rollup buckets that start in
+    [start_ts, end_ts), ordered by bucket then platform."""
+    table, period, origin = ROLLUPS[resolution]
+    if start_ts is not None:
+        # Include the bucket the range starts in.
+        start_ts -= (start_ts - origin) % period
+    client = get_read_client()
+
+    try:
+        query = f"""
+            SELECT
+                r.bucket_start,
+                p.id as platform_id,
+                p.name as platform_name,
+                r.min_global,
+                r.max_global,
+                r.avg_global,
+                r.min_specific,
+                r.max_specific,
+                r.avg_specific,
+                r.covered_seconds
+            FROM {table} r
+            JOIN platforms p ON r.platform_id = p.id
+            WHERE r.store_id = ?
+        """
+        params = [store_id]
+
+        if platform_ids:
+            query += f" AND r.platform_id IN ({','.join(['?'] * len(platform_ids))})"
+            params.extend(platform_ids)
+
+        if start_ts is not None:
+            query += " AND r.bucket_start >= ?"
+            params.append(int(start_ts))
+
+        if end_ts is not None:
+            query += " AND r.bucket_start < ?"
+            params.append(int(end_ts))
+
+        query += " ORDER BY r.bucket_start ASC, r.platform_id ASC"
+
+        rs = client.execute(query, params, name='cashback_rollups')
         return rs.rows
     finally:
         client.close()
 
-def get_cashback_history(store_id, start_date=None, end_date=None, platform_ids=None):
-    raw_conn = get_client() 
-    client = LocalClientWrapper(raw_conn)
+def get_cashback_history(store_id, start_date=None, end_date=None, platform_ids=None, after=None, limit=None):
+    """Returns the store's cashback rows ordered by (date_start, id).
+
+    `after` is the (date_start, id) of the last row of the previous page and
+    `limit` caps the page size.
+    """
+    client = get_read_client()
 
     try:
         query = """
@@ -453,14 +1877,23 @@ def get_cashback_history(store_id, start_date=None, end_date=None, platform_ids=
                 c.date_start,
                 c.date_end,
                 p.name as platform_name,
-                p.id as platform_id
-            FROM partnerships pa
+                p.id as platform_id,
+                c.local_start,
+                c.local_end,
+                c.id as cashback_id,
+                c.ts_start as ts,
+                c.ts_end
+            FROM cashbacks c
+            JOIN partnerships pa ON pa.id = c.partnership_id
             JOIN platforms p ON pa.platform_id = p.id
-            JOIN cashbacks c ON pa.id = c.partnership_id
-            WHERE pa.store_id = ?
+            WHERE c.store_id = ?
         """
         params = [store_id]
 
+        if platform_ids:
+            query += f" AND pa.platform_id IN ({','.join(['?'] * len(platform_ids))})"
+            params.extend(platform_ids)
+
         if start_date:
 
             query += " AND (c.date_end >= ? OR c.date_end IS NULL)"
@@ -470,14 +1903,17 @@ def get_cashback_history(store_id, start_date=None, end_date=None, platform_ids=
             query += " AND c.date_start <= ?"
             params.append(end_date)
 
-        query += " ORDER BY c.date_start ASC"
+        if after:
+            query += " AND (c.date_start > ? OR (c.date_start = ? AND c.id > ?))"
+            params.extend([after[0], after[0], after[1]])
 
-        rs = client.execute(query, params)
-        rows = rs.rows
+        query += " ORDER BY c.date_start ASC, c.id ASC"
 
-        if platform_ids:
-             rows = [r for r in rows if r['platform_id'] in platform_ids]
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
 
-        return rows
+        rs = client.execute(query, params, name='cashback_history')
+        return rs.rows
     finally:
         client.close()
@@ -0,0 +1,133 @@
+"""Builds a synthetic cache database for benchmarks.
+
+The rows are staged and published through CacheManager._publish_changes,
+the same path a full sync takes, so the derived columns, the search index,
+the rollups and the metadata match what a real sync would produce.
+
+Usage: python generate_cache.py [--out bench_data/cache.db] [--stores 1000]
+           [--platforms 12] [--partnerships-per-store 3] [--years 2]
+           [--offers-per-month 2] [--seed 42]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from datetime import datetime, timezone
+
+import bench_common
+
+PLATFORM_NAMES = ["Méliuz", "Cuponomia", "Inter Shop", "Zoom", "Buscapé", "PicPay", "Ame", "Livelo",
+                  "Esfera", "Smiles", "Dotz", "Nubank Shopping", "Mercado Pago", "Banco Pan", "Itaú Shop"]
+
+WORDS = ["Magazine", "Luíza", "Casas", "Bahia", "Americanas", "Submarino", "Netshoes", "Centauro",
+         "Drogaria", "São", "Paulo", "Farmácia", "Pão", "Açúcar", "Óticas", "Calçados", "Livraria",
+         "Cultura", "Renner", "Riachuelo", "Boticário", "Natura", "Decolar", "Hotéis", "Shopee"]
+
+SYLLABLES = ["ba", "ca", "da", "fe", "go", "lu", "ma", "ne", "pi", "ro", "sa", "ta", "vi", "xo", "zu", "ção", "lã", "mé"]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--out", default=os.path.join("bench_data", "cache.db"))
+    parser.add_argument("--stores", type=int, default=1000)
+    parser.add_argument("--platforms", type=int, default=12)
+    parser.add_argument("--partnerships-per-store", type=int, default=3, help="average")
+    parser.add_argument("--years", type=float, default=2)
+    parser.add_argument("--offers-per-month", type=float, default=2)
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args(argv)
+
+def store_names(rng, count):
+    names = set()
+    while len(names) < count:
+        name = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+        if rng.random() < 0.2:
+            name += " " + rng.choice(WORDS)
+        names.add(name)
+    return sorted(names)
+
+def utc(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+def offers(rng, partnership_id, start, end, per_month):
+    """Yields consecutive offers of one partnership covering [start, end]."""
+    mean_duration = 30 * 86400 / per_month
+    value = rng.randint(1, 20) / 2
+    t = start + rng.uniform(0, mean_duration)
+    while t < end:
+        duration = max(rng.expovariate(1 / mean_duration), 3600)
+        value = min(max(value + rng.choice([-1, -0.5, 0, 0.5, 1]), 0.5), 25)
+        boosted = rng.random() < 0.15
+        specific = value * 2 if boosted else value
+        description = f"Até {specific:g}% em produtos selecionados" if boosted else ""
+        yield (partnership_id, value, specific, description, utc(t), utc(min(t + duration, end)))
+        t += duration
+
+def synthetic_rows(args, now):
+    """Returns the stores, platforms and partnerships rows and an iterator over
+    lists of cashback rows (one list per partnership), in STAGED_TABLES column order."""
+    rng = random.Random(args.seed)
+    start = now - int(args.years * 365 * 86400)
+
+    platform_count = args.platforms
+    platforms = [(i, PLATFORM_NAMES[i - 1] if i <= len(PLATFORM_NAMES) else f"Plataforma {i}", f"https://platform{i}.example")
+                 for i in range(1, platform_count + 1)]
+    stores = [(i, name, f"https://store{i}.example") for i, name in enumerate(store_names(rng, args.stores), 1)]
+
+    partnerships = []
+    per_store = min(args.partnerships_per_store, platform_count)
+    for store_id, _, _ in stores:
+        for platform_id in rng.sample(range(1, platform_count + 1), rng.randint(1, 2 * per_store - 1) if per_store > 1 else 1):
+            partnerships.append((len(partnerships) + 1, store_id, platform_id, f"https://platform{platform_id}.example/s/{store_id}"))
+
+    def cashbacks():
+        cashback_id = 0
+        for partnership_id, _, _, _ in partnerships:
+            batch = []
+            for offer in offers(rng, partnership_id, start, now, args.offers_per_month):
+                cashback_id += 1
+                batch.append((cashback_id,) + offer)
+            yield batch
+
+    return stores, platforms, partnerships, cashbacks()
+
+def generate(manager, args):
+    """Publishes a synthetic data set into `manager`'s cache."""
+    now = int(time.time())
+    stores, platforms, partnerships, cashbacks = synthetic_rows(args, now)
+
+    with manager._sync_lock:
+        for table, rows in (("stores", stores), ("platforms", platforms), ("partnerships", partnerships)):
+            manager._reset_stage(table)
+            manager._stage_rows(table, rows)
+
+        manager._reset_stage("cashbacks")
+        for batch in cashbacks:
+            manager._stage_rows("cashbacks", batch)
+        manager.conn.commit()
+
+        tables = {table: now for table in ("stores", "platforms", "partnerships", "cashbacks")}
+        manager._publish_changes(tables, {'full': True, 'deletes': [], 'seq': None}, now)
+        manager.last_sync = now
+        manager._publish_index_snapshot(manager.generation + 1)
+
+def main(argv=None):
+    args = parse_args(argv)
+    out_dir = os.path.dirname(args.out)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(args.out + suffix):
+            os.remove(args.out + suffix)
+
+    db = bench_common.offline_db(args.out)
+
+    started = time.perf_counter()
+    generate(db.cache_manager, args)
+    db.cache_manager.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    counts = bench_common.count_rows(db, db.cache_manager.conn)
+    print(f"Generated {args.out} in {time.perf_counter() - started:.1f}s: "
+          + ", ".join(f"{count} {table}" for table, count in counts.items()))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,93 @@
+"""Local stand-in for the Turso database.
+
+LocalRemoteClient serves a SQLite file that has the schema.txt tables,
+triggers and views through the async client interface the sync uses, so
+sync_from_turso can be tested and benchmarked without network access:
+
+    manager.remote_client_factory = remote_standin.factory("remote.db", latency=0.03)
+
+Round-trip latency, a bandwidth limit and random failures can be injected.
+"""
+import os
+import random
+import asyncio
+import sqlite3
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema.txt")
+
+class RemoteError(Exception):
+    """Injected failure, raised where the real client would raise a network or server error."""
+
+class ResultSet:
+    def __init__(self, columns, rows, rows_affected):
+        self.columns = columns
+        self.rows = rows
+        self.rows_affected = rows_affected
+
+def create_remote_db(path, schema=SCHEMA_FILE):
+    """Creates a stand-in database at `path` (or completes an existing one) from `schema`."""
+    conn = sqlite3.connect(path)
+    try:
+        with open(schema, encoding="utf-8") as f:
+            conn.executescript(f.read())
+        conn.commit()
+    finally:
+        conn.close()
+
+def _payload_size(rows):
+    """Rough size in bytes of `rows` on the wire."""
+    size = 0
+    for row in rows:
+        for value in row:
+            if isinstance(value, str):
+                size += len(value) + 2
+            elif isinstance(value, bytes):
+                size += len(value)
+            else:
+                size += 8
+    return size
+
+class LocalRemoteClient:
+    """Async client over a local SQLite file.
+
+    Every statement waits `latency` seconds plus its result size over
+    `bandwidth` (bytes per second, None for unlimited). With `error_rate`,
+    that fraction of statements fails with RemoteError after the round
+    trip. Concurrent statements overlap their waits like pipelined requests.
+    """
+
+    def __init__(self, path, latency=0.0, bandwidth=None, error_rate=0.0, seed=None):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self.statements = 0
+        self.bytes_sent = 0
+
+    async def execute(self, sql, params=()):
+        self.statements += 1
+        if self.error_rate and self._rng.random() < self.error_rate:
+            await asyncio.sleep(self.latency)
+            raise RemoteError(f"Injected failure of statement {self.statements}")
+
+        cursor = self.conn.execute(sql, params or ())
+        rows = cursor.fetchall()
+        columns = tuple(d[0] for d in cursor.description) if cursor.description else ()
+        if self.conn.in_transaction:
+            self.conn.commit()
+
+        size = _payload_size(rows)
+        self.bytes_sent += size
+        delay = self.latency + (size / self.bandwidth if self.bandwidth else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return ResultSet(columns, rows, cursor.rowcount)
+
+    async def close(self):
+        self.conn.close()
+
+def factory(path, **options):
+    """Returns a remote_client_factory that opens a LocalRemoteClient on `path` per sync."""
+    return lambda: LocalRemoteClient(path, **options)
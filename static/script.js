@@ -9,154 +9,98 @@ document.addEventListener('DOMContentLoaded', function () {
     const searchInput = document.querySelector('input[name="q"]');
     const filterCheckboxes = document.querySelectorAll('input[name="platforms"]');
     const sortSelect = document.getElementById('sort-select');
-    const cards = document.querySelectorAll('.store-card');
     const grid = document.querySelector('.grid');
+    const emptyState = document.getElementById('empty-state');
+    const loadMore = document.getElementById('load-more');
 
-    
-    const storeData = Array.from(cards).map(card => {
-        return {
-            element: card,
-            name: card.dataset.name,
-            offers: JSON.parse(card.dataset.offers),
-            hero: card.querySelector('.cashback-hero'),
-            badgeName: card.querySelector('.badge-platform-name'),
-            badgeContainer: card.querySelector('.platform-badge'),
-            currentMax: 0
-        };
-    });
+    if (!grid) return;
 
-    function updateView() {
-        const query = searchInput.value.toLowerCase().trim();
-        const activePlatformIds = Array.from(filterCheckboxes)
-            .filter(cb => cb.checked)
-            .map(cb => parseInt(cb.value));
-
-        const sortBy = sortSelect ? sortSelect.value : 'cashback-desc';
-        const allFiltersDisabled = activePlatformIds.length === 0;
-
-        const visibleStores = [];
-
-        storeData.forEach(store => {
-            
-            if (!store.name.includes(query)) {
-                store.element.style.display = 'none';
-                return;
-            }
-
-            
-            let displayValue = 0;
-            let displayPlatform = '';
-            let shouldShow = false;
-
-            const viewModeRadio = document.querySelector('input[name="view-mode"]:checked');
-            const viewMode = viewModeRadio ? viewModeRadio.value : 'global';
-
-            if (allFiltersDisabled) {
-                
-                shouldShow = true;
-
-                let maxVal = -1;
-                let bestOffer = null;
-
-                if (store.offers && store.offers.length > 0) {
-                    store.offers.forEach(offer => {
-                        let val = offer.value;
-                        if (viewMode === 'max' && offer.value_specific > val) {
-                            val = offer.value_specific;
-                        }
-                        if (val > maxVal) {
-                            maxVal = val;
-                            bestOffer = { ...offer, effectiveValue: val };
-                        }
-                    });
-                }
+    let page = 1;
+    let requestId = 0;
+    let debounceTimer = null;
 
-                if (bestOffer) {
-                    displayValue = bestOffer.effectiveValue;
-                    displayPlatform = bestOffer.platform_name;
-                } else {
-                    displayValue = 0;
-                    displayPlatform = '';
-                }
-            } else {
-                
-                let maxVal = -1;
-                let bestOffer = null;
-
-                
-                const viewModeRadio = document.querySelector('input[name="view-mode"]:checked');
-                const viewMode = viewModeRadio ? viewModeRadio.value : 'global';
-
-                store.offers.forEach(offer => {
-                    if (activePlatformIds.includes(parseInt(offer.platform_id))) {
-                        
-                        let val = offer.value;
-                        if (viewMode === 'max' && offer.value_specific > val) {
-                            val = offer.value_specific;
-                        }
-
-                        if (val > maxVal) {
-                            maxVal = val;
-                            bestOffer = { ...offer, effectiveValue: val };
-                        }
-                    }
-                });
-
-                if (bestOffer) {
-                    shouldShow = true;
-                    displayValue = bestOffer.effectiveValue;
-                    displayPlatform = bestOffer.platform_name;
-                } else {
-                    
-                    shouldShow = false;
-                }
-            }
+    // The server ranks, filters and paginates; this only builds the query.
+    function listingParams(pageNumber) {
+        const params = new URLSearchParams();
 
-            
-            if (shouldShow) {
-                store.hero.textContent = Number(displayValue.toFixed(2)) + '%';
-                store.currentMax = displayValue;
+        const query = searchInput ? searchInput.value.trim() : '';
+        if (query) params.set('q', query);
 
-                if (displayValue > 0 && displayPlatform) {
-                    store.badgeName.textContent = displayPlatform;
-                    store.badgeContainer.style.display = 'flex';
+        // Every platform checked or none checked both mean "all platforms".
+        const checked = Array.from(filterCheckboxes).filter(cb => cb.checked).map(cb => cb.value);
+        if (checked.length > 0 && checked.length < filterCheckboxes.length) {
+            params.set('platforms', checked.join(','));
+        }
+
+        const viewModeRadio = document.querySelector('input[name="view-mode"]:checked');
+        params.set('mode', viewModeRadio ? viewModeRadio.value : 'global');
+        params.set('sort', sortSelect ? sortSelect.value : 'cashback-desc');
+        params.set('page', pageNumber);
+        return params;
+    }
+
+    function renderCard(store) {
+        const card = document.createElement('a');
+        card.href = `/store/${store.id}`;
+        card.className = 'card store-card';
+
+        const name = document.createElement('span');
+        name.className = 'store-name';
+        name.textContent = store.name;
+
+        const hero = document.createElement('div');
+        hero.className = 'cashback-hero';
+        hero.textContent = Number(store.max_cashback.toFixed(2)) + '%';
+
+        const badge = document.createElement('div');
+        badge.className = 'platform-badge';
+        badge.append('Via ');
+        const badgeName = document.createElement('span');
+        badgeName.className = 'badge-platform-name';
+        badgeName.textContent = store.platform_name;
+        badge.appendChild(badgeName);
+        if (!(store.max_cashback > 0 && store.platform_name)) {
+            badge.style.display = 'none';
+        }
+
+        card.append(name, hero, badge);
+        return card;
+    }
+
+    function loadPage(pageNumber) {
+        const id = ++requestId;
+        return fetch(`${grid.dataset.api}?${listingParams(pageNumber)}`)
+            .then(response => response.json())
+            .then(data => {
+                // A newer request was made while this one was in flight.
+                if (id !== requestId) return;
+
+                const fragment = document.createDocumentFragment();
+                data.stores.forEach(store => fragment.appendChild(renderCard(store)));
+                if (pageNumber === 1) {
+                    grid.replaceChildren(fragment);
                 } else {
-                    store.badgeContainer.style.display = 'none';
+                    grid.appendChild(fragment);
                 }
 
-                store.element.style.display = 'flex';
-                visibleStores.push(store);
-            } else {
-                store.element.style.display = 'none';
-            }
-        });
-
-        
-        visibleStores.sort((a, b) => {
-            if (sortBy === 'cashback-desc') {
-                return b.currentMax - a.currentMax;
-            } else if (sortBy === 'name-asc') {
-                return a.name.localeCompare(b.name);
-            } else if (sortBy === 'name-desc') {
-                return b.name.localeCompare(a.name);
-            }
-            return 0;
-        });
+                page = pageNumber;
+                if (emptyState) emptyState.style.display = data.total === 0 ? '' : 'none';
+                if (loadMore) loadMore.style.display = data.has_more ? '' : 'none';
 
-        
-        visibleStores.forEach(store => {
-            grid.appendChild(store.element);
-        });
+                const countEl = document.getElementById('store-count');
+                if (countEl) {
+                    const numEl = countEl.querySelector('.count-number');
+                    if (numEl) numEl.textContent = data.total;
+                }
+            })
+            .catch(error => console.error('Failed to load stores', error));
+    }
 
-        
-        const countEl = document.getElementById('store-count');
-        if (countEl) {
-            const numEl = countEl.querySelector('.count-number');
-            if (numEl) numEl.textContent = visibleStores.length;
-        }
+    function updateView() {
+        clearTimeout(debounceTimer);
+        debounceTimer = setTimeout(() => loadPage(1), 150);
     }
 
-    
     if (searchInput) {
         searchInput.addEventListener('input', updateView);
     }
@@ -174,11 +118,16 @@ document.addEventListener('DOMContentLoaded', function () {
         sortSelect.addEventListener('change', updateView);
     }
 
+    if (loadMore) {
+        loadMore.addEventListener('click', () => loadPage(page + 1));
+    }
+
     const form = document.querySelector('.search-container');
     if (form) {
-        form.addEventListener('submit', e => e.preventDefault());
+        form.addEventListener('submit', e => {
+            e.preventDefault();
+            clearTimeout(debounceTimer);
+            loadPage(1);
+        });
     }
-
-    
-    updateView();
 });
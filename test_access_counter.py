@@ -0,0 +1,78 @@
+import os
+
+import pytest
+
+import app
+
+@pytest.fixture
+def counters(tmp_path):
+    path = str(tmp_path / "access_counts.csv")
+    made = []
+    def make():
+        counter = app.AccessCounter(path, interval=3600)
+        made.append(counter)
+        return counter
+    yield path, make
+    for counter in made:
+        counter._stopped.set()
+        counter._wake.set()
+
+def test_record_and_flush(counters):
+    path, make = counters
+    counter = make()
+    counter.record("1.1.1.1", "2026-01-01 10:00:00")
+    counter.record("1.1.1.1", "2026-01-01 11:00:00")
+    counter.record("2.2.2.2", "2026-01-01 09:00:00")
+    assert not os.path.exists(path)
+
+    counter.flush()
+    assert counter._read() == {
+        "1.1.1.1": {'count': 2, 'last_access': "2026-01-01 11:00:00"},
+        "2.2.2.2": {'count': 1, 'last_access': "2026-01-01 09:00:00"},
+    }
+    assert sorted(os.listdir(os.path.dirname(path))) == ["access_counts.csv", "access_counts.csv.lock"]
+
+def test_counters_merge_into_one_file(counters):
+    path, make = counters
+    first, second = make(), make()
+    first.record("1.1.1.1", "2026-01-01 10:00:00")
+    second.record("1.1.1.1", "2026-01-01 08:00:00")
+    second.record("3.3.3.3", "2026-01-01 12:00:00")
+    first.flush()
+    second.flush()
+    first.record("3.3.3.3", "2026-01-01 13:00:00")
+    first.flush()
+
+    assert first._read() == {
+        "1.1.1.1": {'count': 2, 'last_access': "2026-01-01 10:00:00"},
+        "3.3.3.3": {'count': 2, 'last_access': "2026-01-01 13:00:00"},
+    }
+
+def test_failed_write_keeps_the_deltas(counters, monkeypatch):
+    path, make = counters
+    counter = make()
+    counter.record("1.1.1.1", "2026-01-01 10:00:00")
+
+    def fail(src, dst):
+        raise OSError("disk full")
+    monkeypatch.setattr(app.os, "replace", fail)
+    counter.flush()
+    assert not os.path.exists(path)
+    assert os.listdir(os.path.dirname(path)) == ["access_counts.csv.lock"]
+
+    monkeypatch.undo()
+    counter.record("1.1.1.1", "2026-01-01 11:00:00")
+    counter.flush()
+    assert counter._read() == {"1.1.1.1": {'count': 2, 'last_access': "2026-01-01 11:00:00"}}
+
+def test_unreadable_file_is_not_overwritten(counters):
+    path, make = counters
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("ip,count,last_access\n1.1.1.1,many,2026-01-01 10:00:00\n")
+    counter = make()
+    counter.record("2.2.2.2", "2026-01-01 10:00:00")
+    counter.flush()
+
+    with open(path, encoding="utf-8") as f:
+        assert "many" in f.read()
+    assert counter._pending == {"2.2.2.2": [1, "2026-01-01 10:00:00"]}
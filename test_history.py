@@ -0,0 +1,78 @@
+import pytest
+
+import app
+import db
+
+DAY = 86400
+START = 1735700400  # 2025-01-01 03:00 UTC
+
+def offers():
+    """(id, partnership_id, value) rows: 200 daily offers on platform 1 with
+    a spike, and 5 weekly ones on platform 2."""
+    rows = [(i + 1, 1, 10 + i % 3 + (40 if i == 120 else 0), START + i * DAY, START + (i + 1) * DAY) for i in range(200)]
+    rows += [(201 + i, 2, 5 + i, START + i * 7 * DAY, START + (i + 1) * 7 * DAY) for i in range(5)]
+    return rows
+
+@pytest.fixture
+def client(cache, monkeypatch):
+    cache.conn.executescript("""
+        INSERT INTO stores VALUES (1, 'Amazon', 'a');
+        INSERT INTO platforms VALUES (1, 'Méliuz', 'm'), (2, 'Cuponomia', 'c');
+        INSERT INTO partnerships VALUES (1, 1, 1, 'u'), (2, 1, 2, 'u');
+    """)
+    cache.conn.executemany("""
+        INSERT INTO cashbacks (id, partnership_id, value_global, value_specific, description, date_start, date_end, ts_start, ts_end, local_start, local_end)
+        VALUES (?, ?, ?, ?, '', datetime(?, 'unixepoch'), datetime(?, 'unixepoch'), ?, ?, local_time(?), local_time(?))
+    """, [(i, pid, value, value, lo, hi, lo, hi, lo, hi) for i, pid, value, lo, hi in offers()])
+    cache._copy_partnership_columns()
+    cache.conn.commit()
+
+    monkeypatch.setattr(db, "cache_manager", cache)
+    monkeypatch.setattr(app, "page_cache", app.PageCache())
+    return app.app.test_client()
+
+def test_lttb_keeps_endpoints_and_spikes():
+    points = [(x, 50.0 if x == 60 else float(x % 2), None) for x in range(100)]
+    sampled = app.lttb(points, 10)
+    assert len(sampled) == 10
+    assert sampled[0] == points[0] and sampled[-1] == points[-1]
+    assert points[60] in sampled
+    assert app.lttb(points, 100) == points
+
+@pytest.mark.parametrize("platforms, max_points", [(10, 15), (10, 5), (3, 1), (2, 40)])
+def test_downsample_never_exceeds_max_points(platforms, max_points):
+    rows = [{'platform_id': p, 'ts': t, 'value': t % 5, 'date_start': str(t).zfill(6), 'cashback_id': p * 1000 + t}
+            for p in range(platforms) for t in range(p * 3 + 8)]
+    kept = app.downsample_history(rows, max_points)
+    assert len(kept) == min(max_points, len(rows))
+    assert kept == sorted(kept, key=lambda r: (r['date_start'], r['cashback_id']))
+
+def test_cursor_pages_cover_the_history(client):
+    everything = client.get("/api/store/1/history?format=rows").get_json()["history"]
+    assert len(everything) == 205
+
+    pages, cursor = [], None
+    while True:
+        url = "/api/store/1/history?format=rows&limit=60" + (f"&cursor={cursor}" if cursor else "")
+        body = client.get(url).get_json()
+        pages.append(body["history"])
+        cursor = body.get("next_cursor")
+        if cursor is None:
+            break
+    assert [len(page) for page in pages] == [60, 60, 60, 25]
+    assert [row for page in pages for row in page] == everything
+
+def test_max_points(client):
+    body = client.get("/api/store/1/history?max_points=40").get_json()
+    assert body["count"] <= 40 and body["downsampled"] and "next_cursor" not in body
+    values = body["value"]
+    assert 50 in values
+
+    rows = client.get("/api/store/1/history?max_points=40&format=rows").get_json()["history"]
+    assert {row["platform_id"] for row in rows} == {1, 2}
+    assert sum(row["platform_id"] == 2 for row in rows) == 5
+
+def test_max_points_rejects_cursor(client):
+    cursor = client.get("/api/store/1/history?limit=10").get_json()["next_cursor"]
+    assert client.get(f"/api/store/1/history?max_points=40&cursor={cursor}").status_code == 400
+    assert client.get("/api/store/1/history?max_points=0").status_code == 400
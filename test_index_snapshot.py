@@ -0,0 +1,87 @@
+import random
+
+import pytest
+
+import db
+
+def store(store_id, name, *offers):
+    return {'id': store_id, 'name': name, 'offers': [
+        {'platform_id': platform_id, 'platform_name': f"P{platform_id}", 'value': value, 'value_specific': specific}
+        for platform_id, value, specific in offers]}
+
+def test_name_sort_ignores_accents():
+    snapshot = db.IndexSnapshot(1, [
+        store(1, "Óticas Carol", (1, 2.0, None)),
+        store(2, "Natura", (1, 3.0, None)),
+        store(3, "Oticas Diniz", (1, 1.0, None)),
+        store(4, "Ame", (1, 1.0, None)),
+    ])
+    ranked = [entry[1]['id'] for entry in snapshot.ranking([], 'global', 'name-asc')]
+    assert ranked == [4, 2, 1, 3]
+    ranked = [entry[1]['id'] for entry in snapshot.ranking([], 'global', 'name-desc')]
+    assert ranked == [3, 1, 2, 4]
+
+BEST_SQL = """
+    SELECT pa.store_id,
+        MAX(CASE WHEN ? = 'max' AND c.value_specific > c.value_global THEN c.value_specific ELSE c.value_global END)
+    FROM partnerships pa
+    JOIN cashbacks c ON c.id = (
+        SELECT lc.id FROM cashbacks lc
+        WHERE lc.partnership_id = pa.id
+        ORDER BY lc.date_start DESC, lc.id DESC
+        LIMIT 1
+    )
+    WHERE pa.platform_id IN ({placeholders})
+    GROUP BY pa.store_id
+"""
+
+PLATFORMS = 5
+
+@pytest.fixture(scope="module")
+def offers_cache(make_cache):
+    manager = make_cache()
+    conn = manager.conn
+
+    rng = random.Random(11)
+    conn.executemany("INSERT INTO stores (id, name, url) VALUES (?, ?, '')", [(i, f"Store {i}") for i in range(1, 301)])
+    conn.executemany("INSERT INTO platforms (id, name, url) VALUES (?, ?, '')", [(i, f"Platform {i}") for i in range(1, PLATFORMS + 1)])
+    partnerships, cashbacks = [], []
+    for store_id in range(1, 301):
+        for platform_id in rng.sample(range(1, PLATFORMS + 1), rng.randint(1, 3)):
+            partnerships.append((len(partnerships) + 1, store_id, platform_id))
+            for day in range(2):
+                # Coarse values, so ties between stores and platforms are common.
+                value = rng.randint(0, 8) / 2
+                specific = rng.choice([None, value, value + 1])
+                cashbacks.append((len(cashbacks) + 1, len(partnerships), value, specific, f"2024-01-0{day + 1} 00:00:00"))
+    conn.executemany("INSERT INTO partnerships (id, store_id, platform_id, url) VALUES (?, ?, ?, '')", partnerships)
+    conn.executemany("INSERT INTO cashbacks (id, partnership_id, value_global, value_specific, description, date_start, date_end) VALUES (?, ?, ?, ?, '', ?, ?)",
+                     [row + (row[-1],) for row in cashbacks])
+    conn.commit()
+    return manager
+
+@pytest.mark.parametrize("platform_ids", [[], [1], [2, 4], [99]])
+@pytest.mark.parametrize("mode", ["global", "max"])
+def test_offer_matrix_matches_sql(offers_cache, platform_ids, mode):
+    snapshot = db.IndexSnapshot(1, offers_cache._load_stores_with_all_cashbacks())
+    matrix = snapshot.matrix
+    values, platforms = matrix.best(platform_ids, mode)
+
+    wanted = platform_ids or list(range(1, PLATFORMS + 1))
+    expected = dict(offers_cache.conn.execute(BEST_SQL.format(placeholders=",".join("?" * len(wanted))), [mode, *wanted]).fetchall())
+    best = {store['id']: values[r] for r, store in enumerate(snapshot.stores) if values[r] >= 0}
+    assert best == expected
+
+    for r, store in enumerate(snapshot.stores):
+        if values[r] >= 0:
+            offer = next(o for o in store['offers'] if o['platform_id'] == platforms[r])
+            specific = offer['value_specific']
+            value = specific if mode == 'max' and specific is not None and specific > offer['value'] else offer['value']
+            assert value == values[r]
+
+    # Descending by value, ties in snapshot order; the limited top is a prefix.
+    ranked = sorted((r for r in range(len(snapshot.stores)) if values[r] >= 0),
+                    key=lambda r: -values[r])
+    assert matrix.top(values) == ranked
+    for limit in (1, 10, 60, 1000):
+        assert matrix.top(values, limit) == ranked[:limit]
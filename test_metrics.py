@@ -0,0 +1,29 @@
+import metrics
+
+def test_histogram_is_cumulative():
+    histogram = metrics.Histogram("test_latency_seconds", "Test latency.", ["route"], buckets=(0.1, 1.0))
+    histogram.observe(0.05, "a")
+    histogram.observe(0.5, "a")
+    histogram.observe(5, "a")
+
+    lines = metrics.render().splitlines()
+    assert "# TYPE test_latency_seconds histogram" in lines
+    assert 'test_latency_seconds_bucket{route="a",le="0.1"} 1' in lines
+    assert 'test_latency_seconds_bucket{route="a",le="1"} 2' in lines
+    assert 'test_latency_seconds_bucket{route="a",le="+Inf"} 3' in lines
+    assert 'test_latency_seconds_sum{route="a"} 5.55' in lines
+    assert 'test_latency_seconds_count{route="a"} 3' in lines
+
+def test_counter_and_collector_labels_are_escaped():
+    counter = metrics.Counter("test_rows_total", "Test rows.", ["query"])
+    counter.inc(3, 'say "hi"')
+    counter.inc(2, 'say "hi"')
+
+    @metrics.register_collector
+    def collect():
+        yield "test_ratio", "gauge", "Test gauge.", [({'kind': 'a\\b'}, 0.5), ({'kind': 'none'}, None)]
+
+    lines = metrics.render().splitlines()
+    assert 'test_rows_total{query="say \\"hi\\""} 5' in lines
+    assert 'test_ratio{kind="a\\\\b"} 0.5' in lines
+    assert not any(line.startswith('test_ratio{kind="none"}') for line in lines)
@@ -0,0 +1,31 @@
+import pytest
+
+import app
+import db
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(app, "page_cache", app.PageCache())
+    monkeypatch.setattr(db, "get_sync_generation", lambda: 1)
+    return app.app.test_client()
+
+def test_sync_checks_keep_cached_pages(client, monkeypatch):
+    monkeypatch.setattr(db, "get_last_sync_time", lambda: 1760000000)
+    first = client.get("/platforms")
+    assert app.to_brasilia(1760000000).encode() in first.data
+    assert app.LAST_SYNC_MARKER not in first.data
+
+    monkeypatch.setattr(db, "get_last_sync_time", lambda: 1760003600)
+    second = client.get("/platforms")
+    assert app.page_cache.hits == 1 and app.page_cache.misses == 1
+    assert app.to_brasilia(1760003600).encode() in second.data
+    assert second.headers["ETag"] != first.headers["ETag"]
+
+    assert client.get("/platforms", headers={"If-None-Match": second.headers["ETag"]}).status_code == 304
+    assert client.get("/platforms", headers={"If-None-Match": first.headers["ETag"]}).status_code == 200
+
+def test_new_generation_renders_again(client, monkeypatch):
+    client.get("/platforms")
+    monkeypatch.setattr(db, "get_sync_generation", lambda: 2)
+    client.get("/platforms")
+    assert app.page_cache.misses == 2
@@ -0,0 +1,158 @@
+import random
+import re
+
+import pytest
+
+import db
+
+STORES = 2000
+PLATFORMS = 12
+PLATFORMS_PER_STORE = 4
+CASHBACKS_PER_PARTNERSHIP = 60
+
+# Plan lines each query is allowed to contain that would otherwise count as a
+# SCAN or USE TEMP B-TREE regression.
+ALLOWED = {
+    # The index page lists every partnership, so walking them all is expected.
+    'index_snapshot': {'SCAN pa USING COVERING INDEX idx_partnerships_platform'},
+    'store_details': set(),
+    'cashback_history': set(),
+    'cashback_rollups': set(),
+    'platforms': {'SCAN platforms USING INDEX sqlite_autoindex_platforms_1'},
+    # Trigram lookups are reported as virtual table scans.
+    'store_search': {'SCAN stores_fts VIRTUAL TABLE INDEX 0:M1'},
+    'sync_watermarks': set(),
+    'sync_cdc_seq': set(),
+    # Reads every row of the staged delta.
+    'sync_rollups': {'SCAN temp.stage_cashbacks'},
+    'view_latest_cashbacks': {'SCAN c USING INDEX idx_cashbacks_latest'},
+}
+
+# Local queries issued by CacheManager.sync_from_turso, and the views it creates.
+LOCAL_QUERIES = {
+    'sync_watermarks': lambda cache: cache._read_watermarks(),
+    'sync_cdc_seq': lambda cache: cache._read_cdc_seq(),
+    'sync_rollups': lambda cache: (
+        cache._reset_stage('cashbacks'),
+        cache._update_rollups(cache._rollup_rows([1, 2])),
+        cache._refresh_rollup(*db.ROLLUPS['daily'], 1, [(0, 2 ** 31)], 2 ** 31),
+    ),
+    'view_latest_cashbacks': lambda cache: cache.conn.execute("SELECT cashback_id FROM vw_latest_cashbacks").fetchall(),
+}
+
+SUBQUERY_SCAN = re.compile(r"^SCAN \(subquery-\d+\)$")
+
+def fill_cache(manager):
+    conn = manager.conn
+
+    rng = random.Random(42)
+    cursor = conn.cursor()
+    cursor.executemany("INSERT INTO stores (id, name, url) VALUES (?, ?, ?)",
+                       [(i, f"Store {i}", f"https://store{i}.example") for i in range(1, STORES + 1)])
+    cursor.executemany("INSERT INTO platforms (id, name, url) VALUES (?, ?, ?)",
+                       [(i, f"Platform {i}", f"https://platform{i}.example") for i in range(1, PLATFORMS + 1)])
+
+    partnerships = []
+    for store_id in range(1, STORES + 1):
+        for platform_id in rng.sample(range(1, PLATFORMS + 1), PLATFORMS_PER_STORE):
+            partnerships.append((len(partnerships) + 1, store_id, platform_id, "https://example"))
+    cursor.executemany("INSERT INTO partnerships (id, store_id, platform_id, url) VALUES (?, ?, ?, ?)", partnerships)
+
+    cashbacks = []
+    for partnership_id, _, _, _ in partnerships:
+        for day in range(CASHBACKS_PER_PARTNERSHIP):
+            value = rng.randint(0, 20) / 2
+            date = f"20{20 + day // 12}-{day % 12 + 1:02d}-01 12:00:00"
+            cashbacks.append((len(cashbacks) + 1, partnership_id, value, value + 1, "", date, date))
+    cursor.executemany("INSERT INTO cashbacks (id, partnership_id, value_global, value_specific, description, date_start, date_end) VALUES (?, ?, ?, ?, ?, ?, ?)", cashbacks)
+    cursor.execute("UPDATE cashbacks SET ts_start = CAST(strftime('%s', date_start) AS INTEGER), ts_end = CAST(strftime('%s', date_end) AS INTEGER)")
+    manager._index_store_names()
+    manager._copy_partnership_columns()
+    conn.commit()
+
+    return manager
+
+@pytest.fixture(scope="module")
+def monkeypatch_module():
+    mp = pytest.MonkeyPatch()
+    yield mp
+    mp.undo()
+
+@pytest.fixture(scope="module")
+def cache(make_cache, monkeypatch_module):
+    manager = fill_cache(make_cache())
+    # Reads go through the writer connection, where capture() traces them.
+    monkeypatch_module.setattr(db, "get_read_client", lambda: db.LocalClientWrapper(manager.conn))
+    return manager
+
+def capture(conn, call):
+    """Returns the expanded SQL of every statement executed by `call`.
+
+    Statements run internally by virtual tables are traced with a leading
+    '--' and left out.
+    """
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        call()
+    finally:
+        conn.set_trace_callback(None)
+    return [sql for sql in statements if not sql.startswith("--")]
+
+def collect_queries(cache):
+    queries = {
+        'index_snapshot': capture(cache.conn, cache._load_stores_with_all_cashbacks),
+        'store_details': capture(cache.conn, lambda: db.get_store_details(STORES // 2)),
+        'cashback_history': capture(cache.conn, lambda: db.get_cashback_history(STORES // 2, "2021-01-01 00:00:00", "2022-12-31 23:59:59", [1, 2], ("2021-06-01 12:00:00", 0), 100)),
+        'cashback_rollups': capture(cache.conn, lambda: db.get_cashback_rollups(STORES // 2, 'weekly', 0, 2 ** 31, [1, 2])),
+        'platforms': capture(cache.conn, db.get_platforms),
+        'store_search': capture(cache.conn, lambda: db.search_store_ids("store 12")),
+    }
+    for name, call in LOCAL_QUERIES.items():
+        queries[name] = capture(cache.conn, lambda: call(cache))
+    return queries
+
+def test_every_query_is_covered(cache):
+    queries = collect_queries(cache)
+    assert set(queries) == set(ALLOWED)
+    assert all(queries.values())
+
+def test_no_scan_or_temp_btree_regressions(cache):
+    failures = []
+    for name, statements in collect_queries(cache).items():
+        for sql in statements:
+            for row in cache.conn.execute("EXPLAIN QUERY PLAN " + sql):
+                detail = row[3]
+                if SUBQUERY_SCAN.match(detail) or detail in ALLOWED[name]:
+                    continue
+                if detail.startswith("SCAN") or "USE TEMP B-TREE" in detail:
+                    failures.append(f"{name}: {detail}")
+
+    assert not failures, "\n".join(failures)
+
+def test_store_search_ranking(cache):
+    matches = db.search_store_ids("STORE 12")
+    ranked = sorted(matches, key=matches.get)
+
+    assert ranked[0] == 12
+    assert set(ranked) == {i for i in range(1, STORES + 1) if f"store {i}".startswith("store 12")}
+
+    cache.conn.execute("UPDATE stores SET name = 'Magazine Luíza' WHERE id = 7")
+    cache._index_store_names()
+    assert list(db.search_store_ids("luiza")) == [7]
+
+def test_managed_indexes(cache):
+    cache.conn.execute("CREATE INDEX idx_stale ON stores (url)")
+    cache._create_tables()
+
+    rows = cache.conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx%'").fetchall()
+    assert {row[0] for row in rows} == set(db.CACHE_INDEXES)
+
+def test_slow_query_log_includes_plan(cache, monkeypatch, capsys):
+    monkeypatch.setattr(db, "SLOW_QUERY_SECONDS", 0.0)
+    db.get_store_details(1)
+
+    out = capsys.readouterr().out
+    assert "WARNING: Slow query store_offers" in out
+    assert "SEARCH pa USING INDEX sqlite_autoindex_partnerships_1 (store_id=?)" in out
+    assert "  SEARCH lc USING COVERING INDEX idx_cashbacks_latest (partnership_id=?)" in out
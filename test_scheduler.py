@@ -0,0 +1,51 @@
+import pytest
+
+import db
+
+@pytest.fixture
+def no_jitter(monkeypatch):
+    monkeypatch.setattr(db.random, "uniform", lambda low, high: high)
+
+def test_unchanged_probes_back_off_to_max_interval(no_jitter):
+    scheduler = db.SyncScheduler(min_interval=10, max_interval=100, backoff_max=60)
+    delays = [scheduler.next_delay('unchanged', now=t) for t in range(8)]
+    assert scheduler.interval == 100
+    assert delays[:3] == pytest.approx([15 * 1.1, 22.5 * 1.1, 33.75 * 1.1])
+    assert delays[-1] == pytest.approx(100 * 1.1)
+
+def test_change_resets_the_interval(no_jitter):
+    scheduler = db.SyncScheduler(min_interval=10, max_interval=100, backoff_max=60)
+    for t in range(5):
+        scheduler.next_delay('unchanged', now=t)
+    assert scheduler.next_delay('changed', now=10) == pytest.approx(10 * 1.1)
+    assert scheduler.interval == 10
+
+def test_interval_is_clamped_to_a_quarter_of_the_change_rate(no_jitter):
+    scheduler = db.SyncScheduler(min_interval=10, max_interval=1000, backoff_max=60)
+    scheduler.next_delay('changed', now=0)
+    scheduler.next_delay('changed', now=200)
+    assert scheduler.change_interval == 200
+    for t in range(201, 220):
+        scheduler.next_delay('unchanged', now=t)
+    assert scheduler.interval == 50
+
+    # Never below the minimum, however often the remote changes.
+    for t in range(201, 231):
+        scheduler.next_delay('changed', now=t)
+    scheduler.next_delay('unchanged', now=231)
+    assert scheduler.interval == 10
+
+def test_errors_back_off_exponentially_with_jitter():
+    scheduler = db.SyncScheduler(min_interval=10, max_interval=100, backoff_max=60)
+    for failures, cap in enumerate([20, 40, 60, 60], 1):
+        delay = scheduler.next_delay('error')
+        assert scheduler.failures == failures
+        assert cap / 2 <= delay <= cap
+
+def test_success_resets_the_backoff(no_jitter):
+    scheduler = db.SyncScheduler(min_interval=10, max_interval=100, backoff_max=60)
+    scheduler.next_delay('error')
+    scheduler.next_delay('error')
+    scheduler.next_delay('unchanged', now=0)
+    assert scheduler.failures == 0
+    assert scheduler.next_delay('error') == 20
@@ -0,0 +1,256 @@
+import sqlite3
+
+import pytest
+
+import db
+import remote_standin
+
+@pytest.fixture
+def remote(tmp_path):
+    path = str(tmp_path / "remote.db")
+    remote_standin.create_remote_db(path)
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        INSERT INTO stores VALUES (1, 'Amazon', 'a'), (2, 'Shopee', 's');
+        INSERT INTO platforms VALUES (1, 'Méliuz', 'm'), (2, 'Cuponomia', 'c');
+        INSERT INTO partnerships VALUES (1, 1, 1, 'u'), (2, 1, 2, 'u'), (3, 2, 1, 'u');
+        INSERT INTO cashbacks VALUES
+            (1, 1, 2, 3, '', '2025-01-01 00:00:00', '2025-01-02 00:00:00'),
+            (2, 1, 4, 5, '', '2025-02-01 00:00:00', '2025-02-02 00:00:00'),
+            (3, 2, 1, 1, '', '2025-01-01 00:00:00', '2025-01-02 00:00:00'),
+            (4, 3, 7, 8, '', '2025-01-01 00:00:00', '2025-01-02 00:00:00');
+        UPDATE table_updates SET updated_at = '2026-01-01 00:00:00';
+    """)
+    conn.commit()
+    yield path, conn
+    conn.close()
+
+def cached_cashbacks(manager):
+    return manager.conn.execute("SELECT id, partnership_id, value_global, date_end FROM cashbacks ORDER BY id").fetchall()
+
+def remote_cashbacks(conn):
+    return conn.execute("SELECT id, partnership_id, global_value, date_end FROM cashbacks ORDER BY id").fetchall()
+
+def test_cold_and_incremental_sync(remote, cache):
+    path, conn = remote
+    cache.remote_client_factory = remote_standin.factory(path)
+
+    assert cache.sync_from_turso() == 'changed'
+    assert [tuple(row) for row in cached_cashbacks(cache)] == remote_cashbacks(conn)
+    assert cache.sync_from_turso() == 'unchanged'
+
+    conn.executescript("""
+        UPDATE cashbacks SET date_end = '2025-02-03 00:00:00' WHERE id = 2;
+        DELETE FROM cashbacks WHERE id = 3;
+        INSERT INTO cashbacks VALUES (5, 3, 9, 9, '', '2025-01-02 00:00:00', '2025-01-03 00:00:00');
+        UPDATE table_updates SET updated_at = '2026-01-02 00:00:00' WHERE table_name = 'cashbacks';
+    """)
+    conn.commit()
+
+    assert cache.sync_from_turso() == 'changed'
+    assert [tuple(row) for row in cached_cashbacks(cache)] == remote_cashbacks(conn)
+    assert cache.conn.execute("SELECT value FROM _metadata WHERE key = 'cdc_seq'").fetchone()[0] == "7"
+
+def test_injected_errors_keep_the_cache(remote, cache):
+    path, _ = remote
+    cache.remote_client_factory = remote_standin.factory(path, error_rate=1.0)
+
+    assert cache.sync_from_turso() == 'error'
+    assert cache.sync_from_turso() == 'error'
+    state = cache.state.get()
+    assert state['consecutive_errors'] == 2
+    assert "Injected failure" in state['last_error']
+    assert cached_cashbacks(cache) == []
+
+    cache.remote_client_factory = remote_standin.factory(path, latency=0.01, bandwidth=100000)
+    assert cache.sync_from_turso() == 'changed'
+    assert cache.state.get()['consecutive_errors'] == 0
+    assert len(cached_cashbacks(cache)) == 4
+
+def test_stale_cache_is_rebuilt_in_place(tmp_path, make_cache):
+    path = str(tmp_path / "cache.db")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE _metadata (key TEXT PRIMARY KEY, value TEXT);
+        INSERT INTO _metadata VALUES ('schema_version', '1');
+        CREATE TABLE stores (id INTEGER PRIMARY KEY, name TEXT);
+        CREATE VIEW vw_old AS SELECT * FROM stores;
+    """)
+    conn.commit()
+    inode = db.os.stat(path).st_ino
+
+    make_cache(path)
+    try:
+        # A reader holding the old file sees the new schema, not a deleted inode.
+        assert db.os.stat(path).st_ino == inode
+        names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master")}
+        assert "vw_old" not in names and "cashbacks" in names and "stores_fts" in names
+        assert conn.execute("SELECT value FROM _metadata WHERE key = 'schema_version'").fetchone()[0] == str(db.CACHE_SCHEMA_VERSION)
+    finally:
+        conn.close()
+
+def test_damaged_cache_is_rebuilt_on_error(remote, cache, monkeypatch):
+    path, _ = remote
+    cache.remote_client_factory = remote_standin.factory(path)
+    assert cache.sync_from_turso() == 'changed'
+    monkeypatch.setattr(db, "cache_manager", cache)
+
+    cache.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    page_size = cache.conn.execute("PRAGMA page_size").fetchone()[0]
+    root = cache.conn.execute("SELECT rootpage FROM sqlite_master WHERE name = 'cashbacks'").fetchone()[0]
+    with open(db.LOCAL_DB, 'r+b') as f:
+        f.seek((root - 1) * page_size)
+        f.write(b"\xff" * page_size)
+
+    client = db.get_read_client()
+    try:
+        with pytest.raises(sqlite3.DatabaseError):
+            client.execute("SELECT * FROM cashbacks")
+    finally:
+        client.close()
+
+    assert cache._rebuild_if_corrupt()
+    assert not cache._rebuild_if_corrupt()
+    assert cache.sync_from_turso() == 'changed'
+    assert len(cached_cashbacks(cache)) == 4
+
+def test_follower_waits_for_the_schema(tmp_path, make_cache, monkeypatch):
+    path = str(tmp_path / "cache.db")
+    sqlite3.connect(path).close()
+    monkeypatch.setattr(db, "MULTI_WORKER", True)
+    monkeypatch.setattr(db, "FOLLOWER_STARTUP_TIMEOUT", 0.3)
+
+    with open(path + ".lock", "a+") as leader_lock:
+        assert db._try_lock(leader_lock)
+
+        # The leader never creates the tables: the follower gives up waiting but starts.
+        follower = make_cache(path)
+        assert not follower.is_leader
+        assert follower.last_sync is None and follower.generation == 0
+
+        leader = sqlite3.connect(path)
+        leader.executescript(f"""
+            CREATE TABLE _metadata (key TEXT PRIMARY KEY, value TEXT);
+            INSERT INTO _metadata VALUES ('schema_version', '{db.CACHE_SCHEMA_VERSION}'), ('last_sync', '1700000000');
+        """)
+        leader.commit()
+        leader.close()
+        follower.conn.close()
+        follower._open_follower()
+        assert follower._read_last_sync() == 1700000000.0
+
+def rollups(manager):
+    return {table: [tuple(row) for row in manager.conn.execute(f"SELECT * FROM {table} ORDER BY partnership_id, bucket_start")]
+            for table, _, _ in db.ROLLUPS.values()}
+
+def rebuilt_rollups(manager):
+    manager.conn.execute("BEGIN IMMEDIATE")
+    manager._update_rollups(None)
+    expected = rollups(manager)
+    manager.conn.rollback()
+    return expected
+
+def test_incremental_rollups_match_a_rebuild(remote, cache, monkeypatch):
+    path, conn = remote
+    cache.remote_client_factory = remote_standin.factory(path)
+    clock = [db.datetime(2025, 1, 20, 12, tzinfo=db.timezone.utc).timestamp()]
+    monkeypatch.setattr(db.time, "time", lambda: clock[0])
+
+    # Offer 6 is still running: it ends after the clock.
+    conn.executescript("""
+        INSERT INTO cashbacks VALUES (6, 3, 2, 4, '', '2025-01-10 00:00:00', '2025-03-01 00:00:00');
+    """)
+    conn.commit()
+    assert cache.sync_from_turso() == 'changed'
+    assert rollups(cache) == rebuilt_rollups(cache)
+
+    clock[0] += 2 * 86400
+    conn.executescript("""
+        UPDATE cashbacks SET date_end = '2025-02-05 00:00:00' WHERE id = 2;
+        UPDATE cashbacks SET global_value = 3 WHERE id = 1;
+        DELETE FROM cashbacks WHERE id = 3;
+        INSERT INTO cashbacks VALUES (7, 2, 5, 5, '', '2025-01-15 00:00:00', '2025-01-25 00:00:00');
+        UPDATE table_updates SET updated_at = datetime('now', '+1 day') WHERE table_name = 'cashbacks';
+    """)
+    conn.commit()
+    assert cache.sync_from_turso() == 'changed'
+    assert rollups(cache) == rebuilt_rollups(cache)
+
+    # A quiet remote still rolls the running offer up to now, once per interval.
+    covered = rollups(cache)
+    generation = cache.generation
+    clock[0] += db.ROLLUP_EXTEND_INTERVAL / 2
+    assert cache.sync_from_turso() == 'unchanged'
+    assert rollups(cache) == covered and cache.generation == generation
+
+    clock[0] += 86400
+    assert cache.sync_from_turso() == 'unchanged'
+    assert cache.generation == generation + 1
+    assert rollups(cache) != covered
+    assert rollups(cache) == rebuilt_rollups(cache)
+
+def test_moved_partnership_moves_its_history(remote, cache, monkeypatch):
+    path, conn = remote
+    cache.remote_client_factory = remote_standin.factory(path)
+    monkeypatch.setattr(db, "cache_manager", cache)
+    assert cache.sync_from_turso() == 'changed'
+    assert [row['cashback_id'] for row in db.get_cashback_history(2)] == [4]
+
+    conn.executescript("""
+        INSERT INTO stores VALUES (3, 'Magalu', 'm');
+        UPDATE partnerships SET store_id = 3 WHERE id = 3;
+        UPDATE table_updates SET updated_at = datetime('now', '+1 day') WHERE table_name IN ('stores', 'partnerships');
+    """)
+    conn.commit()
+    assert cache.sync_from_turso() == 'changed'
+
+    assert db.get_cashback_history(2) == []
+    assert [row['cashback_id'] for row in db.get_cashback_history(3)] == [4]
+    assert db.get_cashback_rollups(2, 'daily') == []
+    assert {row['platform_id'] for row in db.get_cashback_rollups(3, 'daily')} == {1}
+
+def test_quiet_checks_are_persisted_at_most_every_interval(remote, cache, monkeypatch):
+    path, _ = remote
+    cache.remote_client_factory = remote_standin.factory(path)
+    clock = [1800000000.0]
+    monkeypatch.setattr(db.time, "time", lambda: clock[0])
+
+    def persisted():
+        return db.json.loads(cache.conn.execute("SELECT value FROM _metadata WHERE key = 'sync_state'").fetchone()[0])
+
+    assert cache.sync_from_turso() == 'changed'
+    clock[0] += 10
+    assert cache.sync_from_turso() == 'unchanged'
+    assert persisted()['last_outcome'] == 'unchanged'
+    first_quiet = persisted()['last_check']
+
+    clock[0] += 10
+    assert cache.sync_from_turso() == 'unchanged'
+    assert persisted()['last_check'] == first_quiet
+    assert cache.state.get()['last_check'] == clock[0]
+
+    clock[0] += db.SYNC_STATE_PERSIST_INTERVAL
+    assert cache.sync_from_turso() == 'unchanged'
+    assert persisted()['last_check'] == clock[0]
+
+def test_writes_in_the_probe_second_are_fetched(remote, cache):
+    path, conn = remote
+    cache.remote_client_factory = remote_standin.factory(path)
+    assert cache.sync_from_turso() == 'changed'
+
+    # The stores stamp is still the current second when the sync fetches them...
+    stamp = conn.execute("SELECT datetime('now', '+1 seconds')").fetchone()[0]
+    conn.execute("UPDATE table_updates SET updated_at = ? WHERE table_name = 'stores'", (stamp,))
+    conn.commit()
+    assert cache.sync_from_turso() == 'changed'
+
+    # ...and another write lands in that second afterwards.
+    conn.execute("INSERT INTO stores VALUES (3, 'Natura', 'n')")
+    conn.execute("UPDATE table_updates SET updated_at = ? WHERE table_name = 'stores'", (stamp,))
+    conn.commit()
+    while conn.execute("SELECT datetime('now') <= ?", (stamp,)).fetchone()[0]:
+        db.time.sleep(0.1)
+
+    assert cache.sync_from_turso() == 'changed'
+    assert [row[0] for row in cache.conn.execute("SELECT id FROM stores ORDER BY id")] == [1, 2, 3]
+    assert cache.sync_from_turso() == 'unchanged'
@@ -32,6 +32,13 @@ def check_remote_schema():
         else:
             print("FAIL: 'table_updates' table MISSING.")
 
+        if 'cashback_changes' in table_names:
+            rs = client.execute("SELECT COUNT(*), MIN(seq), MAX(seq) FROM cashback_changes")
+            count, oldest, newest = rs.rows[0]
+            print(f"PASS: 'cashback_changes' table exists ({count} rows, seq {oldest}..{newest}).")
+        else:
+            print("FAIL: 'cashback_changes' table MISSING.")
+
         print("\nChecking triggers...")
         triggers = client.execute("SELECT name FROM sqlite_master WHERE type='trigger'").rows
         trigger_names = [row[0] for row in triggers]
@@ -41,7 +48,8 @@ def check_remote_schema():
             'tr_stores_ins', 'tr_stores_upd', 'tr_stores_del',
             'tr_platforms_ins', 'tr_platforms_upd', 'tr_platforms_del',
             'tr_partnerships_ins', 'tr_partnerships_upd', 'tr_partnerships_del',
-            'tr_cashbacks_ins', 'tr_cashbacks_upd', 'tr_cashbacks_del'
+            'tr_cashbacks_ins', 'tr_cashbacks_upd', 'tr_cashbacks_del',
+            'tr_cashbacks_log_ins', 'tr_cashbacks_log_upd', 'tr_cashbacks_log_del'
         ]
 
         missing_triggers = [t for t in expected_triggers if t not in trigger_names]